@@ -0,0 +1,119 @@
+"""Daily circulation rollups.
+
+circulation_daily holds one row per (day, book) and is updated in the same transaction as the
+borrow, return or fine payment it counts, so the analytics endpoints never scan
+borrow_transactions. The record_* helpers return ``(sql, params)`` so the sync and async code
+paths share the statements.
+
+    python analytics.py --rebuild    # recompute every rollup from the loan history
+"""
+import argparse
+import logging
+
+from mysql.connector import Error
+
+logger = logging.getLogger(__name__)
+
+
+def record_borrow(day, book_id, category):
+    return (
+        "INSERT INTO circulation_daily (day, book_id, category, borrows) VALUES (%s, %s, %s, 1) "
+        "ON DUPLICATE KEY UPDATE borrows = borrows + 1",
+        (day, book_id, category)
+    )
+
+
+def record_return(day, book_id, category, overdue):
+    overdue = 1 if overdue else 0
+    return (
+        "INSERT INTO circulation_daily (day, book_id, category, returns, overdue_returns) VALUES (%s, %s, %s, 1, %s) "
+        "ON DUPLICATE KEY UPDATE returns = returns + 1, overdue_returns = overdue_returns + %s",
+        (day, book_id, category, overdue, overdue)
+    )
+
+
+def record_fine_payments(day, user_id):
+    # Must run before the pending fines are marked paid
+    return (
+        "INSERT INTO circulation_daily (day, book_id, category, fines_collected) "
+        "SELECT * FROM ("
+        "    SELECT %s AS day, bt.book_id, b.category, SUM(bt.fine) AS fines"
+        "    FROM borrow_transactions bt JOIN books b ON b.book_id = bt.book_id"
+        "    WHERE bt.user_id = %s AND bt.fine > 0 AND bt.fine_paid = FALSE AND bt.payment_status = 'pending'"
+        "    GROUP BY bt.book_id, b.category"
+        ") AS paid "
+        "ON DUPLICATE KEY UPDATE fines_collected = circulation_daily.fines_collected + paid.fines",
+        (day, user_id)
+    )
+
+
+# Rebuilds must also count loans that archive.py has moved out of borrow_transactions
+HISTORY = (
+    "(SELECT book_id, borrow_date, due_date, return_date, status, fine, fine_paid FROM borrow_transactions"
+    " UNION ALL"
+    " SELECT book_id, borrow_date, due_date, return_date, status, fine, fine_paid FROM borrow_transactions_archive)"
+)
+
+REBUILD_STATEMENTS = [
+    "DELETE FROM circulation_daily",
+    "INSERT INTO circulation_daily (day, book_id, category, borrows) "
+    "SELECT * FROM ("
+    "    SELECT DATE(bt.borrow_date) AS day, bt.book_id, b.category, COUNT(*) AS n"
+    "    FROM " + HISTORY + " bt JOIN books b ON b.book_id = bt.book_id"
+    "    GROUP BY DATE(bt.borrow_date), bt.book_id, b.category"
+    ") AS borrowed "
+    "ON DUPLICATE KEY UPDATE borrows = borrowed.n",
+    "INSERT INTO circulation_daily (day, book_id, category, returns, overdue_returns) "
+    "SELECT * FROM ("
+    "    SELECT DATE(bt.return_date) AS day, bt.book_id, b.category, COUNT(*) AS n,"
+    "           SUM(bt.return_date > bt.due_date) AS late"
+    "    FROM " + HISTORY + " bt JOIN books b ON b.book_id = bt.book_id"
+    "    WHERE bt.status = 'returned' AND bt.return_date IS NOT NULL"
+    "    GROUP BY DATE(bt.return_date), bt.book_id, b.category"
+    ") AS returned "
+    "ON DUPLICATE KEY UPDATE returns = returned.n, overdue_returns = returned.late",
+    # Payment time is not recorded, so historical fines are credited to the return day
+    "INSERT INTO circulation_daily (day, book_id, category, fines_collected) "
+    "SELECT * FROM ("
+    "    SELECT DATE(bt.return_date) AS day, bt.book_id, b.category, SUM(bt.fine) AS fines"
+    "    FROM " + HISTORY + " bt JOIN books b ON b.book_id = bt.book_id"
+    "    WHERE bt.fine_paid = TRUE AND bt.return_date IS NOT NULL"
+    "    GROUP BY DATE(bt.return_date), bt.book_id, b.category"
+    ") AS paid "
+    "ON DUPLICATE KEY UPDATE fines_collected = paid.fines",
+]
+
+
+def rebuild(connection):
+    cursor = connection.cursor()
+    try:
+        for statement in REBUILD_STATEMENTS:
+            cursor.execute(statement)
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the circulation analytics rollups.")
+    parser.add_argument('--rebuild', action='store_true', help="Recompute circulation_daily from the loan history")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    from app import get_connection
+
+    connection = get_connection()
+    try:
+        rebuild(connection)
+        logger.info("Rebuilt circulation_daily")
+    except Error as e:
+        logger.error(f"Database error rebuilding analytics: {e}")
+        raise SystemExit(1)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
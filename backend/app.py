@@ -1,59 +1,449 @@
-from flask import Flask, request, jsonify
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity, get_jwt
+from flask import Flask, request, jsonify, make_response, g, has_app_context
+from flask.json.provider import DefaultJSONProvider
+from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity, get_jwt, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_cors import CORS
-import mysql.connector
 from mysql.connector import Error
 import bcrypt
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
 import logging
+import os
 import random
 import string
 import csv
+import gzip
+import time
+import zlib
+from functools import wraps
 from io import StringIO
 
+from db import ReplicaRouter, MemoryWriterStore, RedisWriterStore
+from limits import RateLimiter, AdmissionController, MemoryBucketStore, RedisBucketStore, metrics, queue_wait
+from cache import LRUCache
+from circulation import calculate_fine
+import circulation
+import overdue_notices
+import analytics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = (None, 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+def format_http_date(value):
+    # Same output as werkzeug's http_date (what the default provider emits), without going through email.utils
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    elif value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return (f"{_WEEKDAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month]} {value.year:04d} "
+            f"{value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT")
+
+def json_default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return format_http_date(obj)
+    return DefaultJSONProvider.default(obj)
+
+class OrjsonProvider(DefaultJSONProvider):
+    # Row payloads keep their column order; sorting keys only costs time
+    sort_keys = False
+
+    def _options(self, indent=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.keys() - {'indent', 'separators'}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=json_default, option=self._options(kwargs.get('indent'))).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=json_default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+# Built-in secrets are public, so only the dev server (`python app.py`, or CAMPUSLIB_DEV=1 for the CLI jobs)
+# may fall back to them; gunicorn, uvicorn and every other importer must get them from the environment
+DEV_MODE = __name__ == '__main__' or os.environ.get('CAMPUSLIB_DEV') == '1'
+
+def secret_setting(name, dev_default):
+    value = os.environ.get(name)
+    if value is None:
+        if not DEV_MODE:
+            raise RuntimeError(f"{name} must be set; the built-in value is only used by the development server")
+        value = dev_default
+    return value
+
 app = Flask(__name__)
-app.config['JWT_SECRET_KEY'] = '0afce35125fb4100282bae99fcd6c8eb'
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+# Every node behind a balancer must share JWT_SECRET_KEY
+app.config['JWT_SECRET_KEY'] = secret_setting('JWT_SECRET_KEY', '0afce35125fb4100282bae99fcd6c8eb')
 jwt = JWTManager(app)
 
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+# Number of proxies (load balancers) in front of the app whose X-Forwarded-For can be trusted
+PROXY_COUNT = int(os.environ.get('PROXY_COUNT', '0'))
+if PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_COUNT)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 db_config = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': 'Jaiho@123',
-    'database': 'campuslib'
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'port': int(os.environ.get('DB_PORT', '3306')),
+    'user': os.environ.get('DB_USER', 'root'),
+    'password': secret_setting('DB_PASSWORD', 'Jaiho@123'),
+    'database': os.environ.get('DB_NAME', 'campuslib')
 }
 
-FINE_PER_DAY = 1.0
-BORROW_PERIOD_DAYS = 14
+def parse_replicas(value):
+    # "host[:port],host[:port]" sharing the primary's credentials and database
+    replicas = []
+    for entry in value.split(','):
+        host, _, port = entry.strip().partition(':')
+        if host:
+            replicas.append({**db_config, 'host': host, 'port': int(port or db_config['port'])})
+    return replicas
+
+# Read replicas for read-only endpoints. Empty means every query goes to the primary.
+replica_configs = parse_replicas(os.environ.get('DB_REPLICAS', ''))
+REPLICA_SELECTION = os.environ.get('DB_REPLICA_SELECTION', 'round_robin')  # or 'least_loaded'
+REPLICA_RETRY_SECONDS = 30
+# After a borrow/return (or an admin edit) the users involved read from the primary for this long
+READ_YOUR_WRITES_SECONDS = 10
+# Connections per server per process; 0 opens a new connection for every request (dev server)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '0'))
+
+# Rate limit buckets and recent writers are kept here when set, so they hold across workers and nodes.
+# RATE_LIMIT_REDIS_URL is the older name, still read when REDIS_URL is unset.
+REDIS_URL = os.environ.get('REDIS_URL') or os.environ.get('RATE_LIMIT_REDIS_URL')
+if REDIS_URL and redis is None:
+    logger.warning("REDIS_URL is set but redis is not installed; using in-process rate limits and writers")
+# A Redis that stops answering must fail fast so the in-process fallbacks apply instead of requests hanging
+REDIS_TIMEOUT_SECONDS = float(os.environ.get('REDIS_TIMEOUT_SECONDS', '0.25'))
+redis_client = redis.Redis.from_url(
+    REDIS_URL, socket_timeout=REDIS_TIMEOUT_SECONDS, socket_connect_timeout=REDIS_TIMEOUT_SECONDS
+) if REDIS_URL and redis is not None else None
+
+router = ReplicaRouter(
+    db_config, replica_configs, REPLICA_SELECTION, REPLICA_RETRY_SECONDS, READ_YOUR_WRITES_SECONDS, DB_POOL_SIZE,
+    writers=RedisWriterStore(redis_client) if redis_client else MemoryWriterStore()
+)
+
+# Requests per second and burst size allowed per client (JWT identity, or IP when not logged in)
+RATE_LIMITS = {
+    'login': (0.5, 5),
+    'register': (0.2, 3),
+    'get_books': (5, 20),
+    'get_categories': (5, 20),
+    'import_books': (0.1, 2)
+}
+DEFAULT_RATE_LIMIT = (10, 40)
+RATE_LIMIT_EXEMPT = {'liveness', 'readiness'}
+# Requests allowed in flight per process before new ones are shed with 503, kept below the pool size so a
+# request is never admitted without a connection for it. This binds where threads are unbounded (the dev
+# server, which opens a connection per request); a gthread worker never runs more than WORKER_THREADS requests,
+# so gunicorn.conf.py turns it off there and MAX_QUEUE_WAIT_MS sheds instead. Async mode uses ASYNC_MAX_IN_FLIGHT.
+MAX_IN_FLIGHT_REQUESTS = int(os.environ.get('MAX_IN_FLIGHT_REQUESTS', str(DB_POOL_SIZE - 1 if DB_POOL_SIZE else 50)))
+# Under gunicorn (workers.QueueTimedThreadWorker), requests that waited longer than this for a thread get 503
+MAX_QUEUE_WAIT_MS = int(os.environ.get('MAX_QUEUE_WAIT_MS', '1000'))
+rate_limit_store = RedisBucketStore(redis_client) if redis_client else MemoryBucketStore()
+rate_limiter = RateLimiter(RATE_LIMITS, DEFAULT_RATE_LIMIT, rate_limit_store)
+admission = AdmissionController('wsgi', MAX_IN_FLIGHT_REQUESTS)
+
+# Book and user records by id, for existence checks that do not need the row locked; 0 disables the cache
+LOOKUP_CACHE_SIZE = int(os.environ.get('LOOKUP_CACHE_SIZE', '2048'))
+LOOKUP_CACHE_TTL_SECONDS = int(os.environ.get('LOOKUP_CACHE_TTL_SECONDS', '60'))
+book_cache = LRUCache('books', LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL_SECONDS)
+user_cache = LRUCache('users', LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL_SECONDS)
+
+# How often the server runs the overdue notice job; 0 leaves it to `python overdue_notices.py`.
+# Notices are appended as JSON lines to OVERDUE_NOTICE_OUTPUT, which the interval requires.
+OVERDUE_NOTICE_INTERVAL_SECONDS = int(os.environ.get('OVERDUE_NOTICE_INTERVAL_SECONDS', '0'))
+OVERDUE_NOTICE_OUTPUT = os.environ.get('OVERDUE_NOTICE_OUTPUT')
+if OVERDUE_NOTICE_INTERVAL_SECONDS and not OVERDUE_NOTICE_OUTPUT:
+    raise RuntimeError("OVERDUE_NOTICE_INTERVAL_SECONDS needs OVERDUE_NOTICE_OUTPUT, the file notices are written to")
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Fines grow with wall-clock time, so ETags of fine-bearing payloads also roll over on this interval
+FINE_ETAG_BUCKET_SECONDS = 60
+
+_background_jobs_pid = None
+
+def start_background_jobs():
+    # Called in every serving process: gunicorn's post_fork, the ASGI lifespan and the dev server
+    global _background_jobs_pid
+    if not OVERDUE_NOTICE_INTERVAL_SECONDS or _background_jobs_pid == os.getpid():
+        return
+    _background_jobs_pid = os.getpid()
+    overdue_notices.start_scheduler(
+        router, calculate_fine, OVERDUE_NOTICE_INTERVAL_SECONDS,
+        lambda: overdue_notices.FileSender(OVERDUE_NOTICE_OUTPUT)
+    )
+
+def wants_columns():
+    return request.args.get('format') == 'columns'
+
+def to_columns(rows):
+    # Column-oriented payload: names once, then one array per row
+    if not rows:
+        return {"columns": [], "rows": []}
+    return {"columns": list(rows[0].keys()), "rows": [list(row.values()) for row in rows]}
 
 def generate_library_card_number():
     date_part = datetime.now().strftime('%Y%m%d')
     random_part = ''.join(random.choices(string.digits, k=4))
     return f"LIB-{date_part}-{random_part}"
 
-def calculate_fine(borrow_date, due_date, return_date, status, fine_paid):
-    if fine_paid:
-        return 0.0
+def client_key():
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except (JWTExtendedException, PyJWTError):
+        identity = None
+    return f"user:{identity}" if identity else f"ip:{request.remote_addr}"
+
+@app.before_request
+def admit_request():
+    if request.method == 'OPTIONS' or request.endpoint in RATE_LIMIT_EXEMPT:
+        return None
+
+    waited_ms = getattr(queue_wait, 'seconds', 0.0) * 1000
+    if MAX_QUEUE_WAIT_MS and waited_ms > MAX_QUEUE_WAIT_MS:
+        metrics.incr('rejected_queue_wait', request.endpoint)
+        logger.warning(f"Shedding {request.endpoint}: waited {waited_ms:.0f} ms for a worker thread")
+        return jsonify({"status": "error", "message": "Server busy, try again shortly"}), 503, {'Retry-After': '1'}
+
+    client = client_key()
+    retry_after = rate_limiter.check(request.endpoint, client)
+    if retry_after:
+        logger.warning(f"Rate limited: {client} on {request.endpoint}")
+        return jsonify({"status": "error", "message": "Too many requests"}), 429, {'Retry-After': str(retry_after)}
+
+    if not admission.try_enter():
+        logger.warning(f"Shedding {request.endpoint}: {admission.in_flight} requests in flight")
+        return jsonify({"status": "error", "message": "Server busy, try again shortly"}), 503, {'Retry-After': '1'}
+    g.admitted = True
+    return None
+
+@app.teardown_request
+def leave_admission(exc):
+    if g.pop('admitted', False):
+        admission.leave()
+
+def get_connection(read_only=False, user_id=None):
+    # Command-line jobs (archive.py, analytics.py) run outside any request and always use the primary
+    if not has_app_context():
+        return router.connect()[0]
+    # @versioned leaves the connection it read data_versions on for the view, so the check costs no extra connection
+    reserved = g.pop('reserved_connection', None)
+    if reserved:
+        reserved_read_only, connection = reserved
+        if reserved_read_only == read_only and connection.is_connected():
+            return connection
+        connection.close()
+    if not read_only:
+        return router.connect()[0]
+    # Keep every read of a request on the same replica so lag cannot make later reads older than earlier ones
+    connection, index = router.connect(read_only=True, user_id=user_id, preferred=g.get('replica_index'))
+    if index is not None:
+        g.replica_index = index
+        g.setdefault('replica_leases', []).append(index)
+    return connection
+
+@app.teardown_request
+def close_reserved_connection(exc):
+    # Views that return before querying (403, 304) never claim the reserved connection
+    reserved = g.pop('reserved_connection', None)
+    if reserved and reserved[1].is_connected():
+        reserved[1].close()
+
+@app.teardown_request
+def release_replica_leases(exc):
+    for index in g.pop('replica_leases', []):
+        router.release(index)
+
+def lookup_book(cursor, book_id):
+    # Cached records leave out available_copies, which must always be read from the database
+    return circulation.run(cursor, circulation.lookup(book_cache, circulation.BOOK_LOOKUP_SQL, book_id))
+
+def lookup_user(cursor, user_id):
+    return circulation.run(cursor, circulation.lookup(user_cache, circulation.USER_LOOKUP_SQL, user_id))
+
+def hold_position(cursor, book_id, hold_id):
+    # Holds are served in hold_id order; the (book_id, status, hold_id) index makes this a range count
+    cursor.execute(
+        "SELECT COUNT(*) AS ahead FROM book_holds WHERE book_id = %s AND status = 'waiting' AND hold_id < %s",
+        (book_id, hold_id)
+    )
+    return cursor.fetchone()['ahead'] + 1
+
+def dispatch_copy(cursor, book_id):
+    return circulation.run(cursor, circulation.dispatch_copy(book_id, datetime.now()))
+
+def settle_expired_holds(connection, cursor, book_id):
+    # Expiries commit on their own so they stick even if the request then fails; callers lock the book again after
+    expired, readied = circulation.run(cursor, circulation.expire_holds(book_id, datetime.now()))
+    if expired:
+        connection.commit()
+        router.note_write(*readied)
+    return expired
 
-    today = datetime.now()
-    due_date = datetime.strptime(due_date, '%Y-%m-%d %H:%M:%S') if isinstance(due_date, str) else due_date
+def bump_data_version(cursor, *names):
+    circulation.run(cursor, circulation.bump_data_version(*names))
 
-    if status == 'returned' and return_date:
-        return_date = datetime.strptime(return_date, '%Y-%m-%d %H:%M:%S') if isinstance(return_date, str) else return_date
-        if return_date <= due_date:
-            return 0.0
-        overdue_days = (return_date - due_date).days
-    else:
-        if today <= due_date:
-            return 0.0
-        overdue_days = (today - due_date).days
+def get_data_versions(names, read_only=False):
+    try:
+        connection = get_connection(read_only=read_only, user_id=get_jwt_identity())
+        cursor = connection.cursor()
+        versions = circulation.run(cursor, circulation.data_versions(names))
+        cursor.close()
+        g.reserved_connection = (read_only, connection)
+        return versions
+    except Error as e:
+        logger.warning(f"Could not read data versions {names}: {e}")
+        if 'connection' in locals() and connection.is_connected():
+            connection.close()
+        return None
+
+def build_etag(names, versions, time_bucket, identity, full_path):
+    parts = [f"{name}{version}" for name, version in zip(names, versions)]
+    if time_bucket:
+        parts.append(str(int(time.time() // time_bucket)))
+    scope = zlib.crc32(f"{identity}|{full_path}".encode('utf-8'))
+    return f"{'-'.join(parts)}-{scope:08x}"
+
+def matching_etag(etag, if_none_match):
+    for candidate in (etag, f"{etag}-gzip", f"{etag}-br"):
+        if if_none_match.contains_weak(candidate):
+            return candidate
+    return None
+
+def compress_body(data, accept_encodings):
+    # Returns the encoded body and its Content-Encoding, or the body unchanged and None
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return data, None
+    encoding = accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY), encoding
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL), encoding
+    return data, None
+
+def versioned(*names, time_bucket=None, read_only=False):
+    # Strong ETags derived from the data_versions counters instead of hashing the body,
+    # so a matching If-None-Match is answered with 304 before the listing query runs
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = get_data_versions(names, read_only)
+            if versions is None:
+                return view(*args, **kwargs)
+
+            etag = build_etag(names, versions, time_bucket, get_jwt_identity(), request.full_path)
+            matched = matching_etag(etag, request.if_none_match)
+            if matched:
+                response = make_response('', 304)
+                response.set_etag(matched)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                # compress_response skips 304s, but the matched ETag may name an encoded representation
+                response.vary.add('Accept-Encoding')
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body, encoding = compress_body(response.get_data(), request.accept_encodings)
+    if not encoding:
+        return response
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    # Each representation needs its own strong validator
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+@app.route('/api/health/live', methods=['GET'])
+def liveness():
+    return jsonify({"status": "success", "pid": os.getpid()}), 200
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness():
+    try:
+        connection = get_connection()
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        return jsonify({"status": "success", "database": router.pool_status()}), 200
+    except Error as e:
+        logger.error(f"Readiness check failed: {e}")
+        return jsonify({"status": "error", "message": f"Database error: {e}", "database": router.pool_status()}), 503
+    finally:
+        if 'connection' in locals() and connection.is_connected():
+            cursor.close()
+            connection.close()
 
-    fine = overdue_days * FINE_PER_DAY
-    return round(fine, 2)
+@app.route('/api/metrics', methods=['GET'])
+@jwt_required()
+def get_metrics():
+    identity = get_jwt_identity()
+    claims = get_jwt()
+    if claims['user_type'] != 'admin':
+        logger.warning(f"Fetch metrics failed: Admin access required for user {identity}")
+        return jsonify({"status": "error", "message": "Admin access required"}), 403
+
+    return jsonify({
+        "status": "success",
+        "in_flight": admission.in_flight,
+        "counters": metrics.snapshot(),
+        "caches": {cache.name: cache.stats() for cache in (book_cache, user_cache)}
+    }), 200
 
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -71,13 +461,14 @@ def register():
 
         hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor()
 
         cursor.execute(
             "INSERT INTO users (name, email, library_card_no, password, user_type) VALUES (%s, %s, %s, %s, %s)",
             (name, email, library_card_no, hashed_password, user_type)
         )
+        bump_data_version(cursor, 'users')
         connection.commit()
         logger.info(f"User registered: {email}, Type: {user_type}")
         return jsonify({"status": "success", "message": "User registered successfully"}), 201
@@ -111,7 +502,7 @@ def create_reader():
         library_card_no = generate_library_card_number()
         hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor()
 
         cursor.execute("SELECT * FROM users WHERE email = %s OR library_card_no = %s", (email, library_card_no))
@@ -123,6 +514,7 @@ def create_reader():
             "INSERT INTO users (name, email, library_card_no, password, user_type) VALUES (%s, %s, %s, %s, %s)",
             (name, email, library_card_no, hashed_password, 'reader')
         )
+        bump_data_version(cursor, 'users')
         connection.commit()
         logger.info(f"Reader created: {email}, Library Card: {library_card_no}")
         return jsonify({
@@ -140,6 +532,7 @@ def create_reader():
 
 @app.route('/api/admin/user-transactions', methods=['GET'])
 @jwt_required()
+@versioned('transactions', 'users', time_bucket=FINE_ETAG_BUCKET_SECONDS)
 def get_user_transactions_by_library_card():
     identity = get_jwt_identity()
     claims = get_jwt()
@@ -153,7 +546,7 @@ def get_user_transactions_by_library_card():
             logger.warning("Fetch user transactions failed: Library card number required")
             return jsonify({"status": "error", "message": "Library card number required"}), 400
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
 
         cursor.execute("SELECT * FROM users WHERE library_card_no = %s", (library_card_no,))
@@ -162,28 +555,7 @@ def get_user_transactions_by_library_card():
             logger.warning(f"User not found with library card: {library_card_no}")
             return jsonify({"status": "error", "message": "User not found"}), 404
 
-        cursor.execute("SELECT * FROM borrow_transactions WHERE user_id = %s", (user['user_id'],))
-        transactions = cursor.fetchall()
-
-        total_fine = 0.0
-        for transaction in transactions:
-            fine = calculate_fine(
-                transaction['borrow_date'],
-                transaction['due_date'],
-                transaction['return_date'],
-                transaction['status'],
-                transaction['fine_paid']
-            )
-            if fine != float(transaction['fine']):
-                cursor.execute(
-                    "UPDATE borrow_transactions SET fine = %s WHERE id = %s",
-                    (fine, transaction['id'])
-                )
-            transaction['fine'] = fine
-            if not transaction['fine_paid'] and transaction['payment_status'] != 'pending':
-                total_fine += fine
-            transaction['fine_paid'] = bool(transaction['fine_paid'])
-            transaction['payment_status'] = transaction['payment_status'] if transaction['payment_status'] else None
+        transactions, total_fine = circulation.run(cursor, circulation.transaction_history(user['user_id']))
 
         connection.commit()
         logger.info(f"Fetched {len(transactions)} transactions for library card {library_card_no}, Total Fine: ${total_fine}")
@@ -195,7 +567,7 @@ def get_user_transactions_by_library_card():
                 "email": user['email'],
                 "library_card_no": user['library_card_no']
             },
-            "transactions": transactions,
+            "transactions": to_columns(transactions) if wants_columns() else transactions,
             "total_fine": total_fine
         }), 200
     except Error as e:
@@ -236,7 +608,7 @@ def import_books():
             logger.warning(f"Import books failed: Missing CSV headers: {missing}")
             return jsonify({"status": "error", "message": f"Missing CSV headers: {missing}"}), 400
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor()
 
         books_added = 0
@@ -257,7 +629,9 @@ def import_books():
                 logger.warning(f"Skipping invalid row: {row}, Error: {e}")
                 continue
 
+        bump_data_version(cursor, 'books')
         connection.commit()
+        router.note_write(identity)
         logger.info(f"Imported {books_added} books by admin {identity}")
         return jsonify({"status": "success", "message": f"Imported {books_added} books successfully"}), 200
     except Error as e:
@@ -275,7 +649,7 @@ def login():
         identifier = data.get('identifier')
         password = data.get('password')
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
 
         cursor.execute(
@@ -301,13 +675,15 @@ def login():
 
 @app.route('/api/books', methods=['GET'])
 @jwt_required()
+@versioned('books', read_only=True)
 def get_books():
     try:
         query = request.args.get('query', '')
         category = request.args.get('category', '')
+        columnar = wants_columns()
 
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
+        connection = get_connection(read_only=True, user_id=get_jwt_identity())
+        cursor = connection.cursor(dictionary=not columnar)
 
         sql = "SELECT * FROM books WHERE 1=1"
         params = []
@@ -321,6 +697,8 @@ def get_books():
         cursor.execute(sql, params)
         books = cursor.fetchall()
         logger.info(f"Fetched {len(books)} books for query: {query}, category: {category}")
+        if columnar:
+            return jsonify({"status": "success", "books": {"columns": list(cursor.column_names), "rows": books}}), 200
         return jsonify({"status": "success", "books": books}), 200
     except Error as e:
         logger.error(f"Database error fetching books: {e}")
@@ -351,7 +729,7 @@ def add_book():
             logger.warning("Add book failed: Missing required fields")
             return jsonify({"status": "error", "message": "Missing required fields"}), 400
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Check for duplicate ISBN
@@ -364,7 +742,9 @@ def add_book():
             "INSERT INTO books (title, author, isbn, category, total_copies, available_copies) VALUES (%s, %s, %s, %s, %s, %s)",
             (title, author, isbn, category, total_copies, total_copies)
         )
+        bump_data_version(cursor, 'books')
         connection.commit()
+        router.note_write(identity)
         logger.info(f"Book added: {title} by {author}")
         return jsonify({"status": "success", "message": "Book added successfully"}), 201
     except Error as e:
@@ -396,7 +776,7 @@ def update_book(book_id):
             logger.warning("Update book failed: Missing required fields")
             return jsonify({"status": "error", "message": "Missing required fields"}), 400
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
 
         # Fetch the current book to validate total_copies and check for duplicate ISBN
@@ -426,7 +806,10 @@ def update_book(book_id):
             logger.warning(f"Update book failed: Book {book_id} not updated")
             return jsonify({"status": "error", "message": "Book not updated"}), 500
 
+        bump_data_version(cursor, 'books')
         connection.commit()
+        book_cache.invalidate(str(book_id))
+        router.note_write(identity)
         logger.info(f"Book updated: {book_id}, Title: {title}")
         return jsonify({"status": "success", "message": "Book updated successfully"}), 200
     except Error as e:
@@ -447,7 +830,7 @@ def delete_book(book_id):
         return jsonify({"status": "error", "message": "Admin access required"}), 403
 
     try:
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor()
 
         cursor.execute("DELETE FROM books WHERE book_id = %s", (book_id,))
@@ -455,7 +838,10 @@ def delete_book(book_id):
             logger.warning(f"Delete book failed: Book {book_id} not found")
             return jsonify({"status": "error", "message": "Book not found"}), 404
 
+        bump_data_version(cursor, 'books')
         connection.commit()
+        book_cache.invalidate(str(book_id))
+        router.note_write(identity)
         logger.info(f"Book deleted: {book_id}")
         return jsonify({"status": "success", "message": "Book deleted successfully"}), 200
     except Error as e:
@@ -468,9 +854,10 @@ def delete_book(book_id):
 
 @app.route('/api/categories', methods=['GET'])
 @jwt_required()
+@versioned('books', read_only=True)
 def get_categories():
     try:
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection(read_only=True, user_id=get_jwt_identity())
         cursor = connection.cursor()
 
         cursor.execute("SELECT DISTINCT category FROM books")
@@ -498,14 +885,20 @@ def request_borrow():
         data = request.get_json()
         book_id = data.get('book_id')
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection(read_only=True, user_id=identity)
         cursor = connection.cursor(dictionary=True)
 
         cursor.execute("SELECT * FROM books WHERE book_id = %s AND available_copies > 0", (book_id,))
         book = cursor.fetchone()
         if not book:
-            logger.warning(f"Borrow request failed: Book {book_id} not available")
-            return jsonify({"status": "error", "message": "Book not available"}), 404
+            # A copy set aside for this reader's hold can still be borrowed
+            cursor.execute(
+                "SELECT hold_id FROM book_holds WHERE book_id = %s AND user_id = %s AND status = 'ready' AND ready_at >= %s",
+                (book_id, identity, datetime.now() - timedelta(days=circulation.HOLD_PICKUP_DAYS))
+            )
+            if not cursor.fetchone():
+                logger.warning(f"Borrow request failed: Book {book_id} not available")
+                return jsonify({"status": "error", "message": "Book not available"}), 404
 
         qr_data = {
             "user_id": identity,
@@ -547,34 +940,22 @@ def confirm_borrow():
             logger.warning(f"Borrow confirm failed: Invalid user_id format: {user_id}")
             return jsonify({"status": "error", "message": "Invalid user_id format"}), 400
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
 
-        # Fetch book and validate availability with a lock to prevent race conditions
-        cursor.execute("SELECT * FROM books WHERE book_id = %s AND available_copies > 0 FOR UPDATE", (book_id,))
-        book = cursor.fetchone()
-        if not book:
-            logger.warning(f"Borrow confirm failed: Book {book_id} not available")
-            return jsonify({"status": "error", "message": "Book not available"}), 404
-
-        cursor.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-        user = cursor.fetchone()
+        # Checked before the book row is locked, so unknown users never hold the lock
+        user = lookup_user(cursor, user_id)
         if not user:
             logger.warning(f"Borrow confirm failed: User {user_id} not found")
             return jsonify({"status": "error", "message": "User not found"}), 404
 
-        borrow_date = datetime.now()
-        due_date = borrow_date + timedelta(days=BORROW_PERIOD_DAYS)
+        due_date, readied = circulation.run(cursor, circulation.confirm_borrow(user_id, book_id, datetime.now()))
+        if due_date is None:
+            logger.warning(f"Borrow confirm failed: Book {book_id} not available")
+            return jsonify({"status": "error", "message": "Book not available"}), 404
 
-        cursor.execute(
-            "UPDATE books SET available_copies = available_copies - 1 WHERE book_id = %s",
-            (book_id,)
-        )
-        cursor.execute(
-            "INSERT INTO borrow_transactions (user_id, book_id, borrow_date, due_date, status) VALUES (%s, %s, %s, %s, %s)",
-            (user_id, book_id, borrow_date, due_date, 'borrowed')
-        )
         connection.commit()
+        router.note_write(identity, user_id, *readied)
         logger.info(f"Borrow confirmed: User {user_id}, Book {book_id}, Due Date: {due_date}")
         return jsonify({"status": "success", "message": "Borrow confirmed"}), 200
     except Error as e:
@@ -598,7 +979,7 @@ def request_return():
         data = request.get_json()
         book_id = data.get('book_id')
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection(read_only=True, user_id=identity)
         cursor = connection.cursor(dictionary=True)
 
         # Check if the user has an active borrow transaction for this book
@@ -612,8 +993,7 @@ def request_return():
             return jsonify({"status": "error", "message": "No active borrow transaction found"}), 404
 
         # Verify the book exists
-        cursor.execute("SELECT * FROM books WHERE book_id = %s", (book_id,))
-        book = cursor.fetchone()
+        book = lookup_book(cursor, book_id)
         if not book:
             logger.warning(f"Return request failed: Book {book_id} not found")
             return jsonify({"status": "error", "message": "Book not found"}), 404
@@ -658,40 +1038,202 @@ def confirm_return():
             logger.warning(f"Return confirm failed: Invalid user_id format: {user_id}")
             return jsonify({"status": "error", "message": "Invalid user_id format"}), 400
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
 
-        cursor.execute(
-            "SELECT * FROM borrow_transactions WHERE user_id = %s AND book_id = %s AND status = 'borrowed'",
-            (user_id, book_id)
+        error, fine, reserved_for, readied = circulation.run(
+            cursor, circulation.confirm_return(user_id, book_id, datetime.now())
         )
-        transaction = cursor.fetchone()
-        if not transaction:
-            logger.warning(f"Return confirm failed: No active borrow transaction for user {user_id}, book {book_id}")
-            return jsonify({"status": "error", "message": "No active borrow transaction found"}), 404
+        if error:
+            logger.warning(f"Return confirm failed: {error} for user {user_id}, book {book_id}")
+            return jsonify({"status": "error", "message": error}), 404
 
-        cursor.execute("SELECT * FROM books WHERE book_id = %s", (book_id,))
+        connection.commit()
+        router.note_write(identity, user_id, reserved_for, *readied)
+        logger.info(f"Return confirmed: User {user_id}, Book {book_id}, Fine: ${fine}, Reserved for: {reserved_for}")
+        return jsonify({"status": "success", "message": "Return confirmed", "fine": fine, "reserved_for": reserved_for}), 200
+    except Error as e:
+        logger.error(f"Database error confirming return: {e}")
+        return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
+    finally:
+        if 'connection' in locals() and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+@app.route('/api/holds', methods=['POST'])
+@jwt_required()
+def place_hold():
+    identity = get_jwt_identity()
+    claims = get_jwt()
+    if claims['user_type'] != 'reader':
+        logger.warning(f"Place hold failed: Reader access required for user {identity}")
+        return jsonify({"status": "error", "message": "Reader access required"}), 403
+
+    try:
+        data = request.get_json()
+        book_id = data.get('book_id')
+
+        if not book_id:
+            logger.warning("Place hold failed: Missing book_id")
+            return jsonify({"status": "error", "message": "Missing book_id"}), 400
+
+        connection = get_connection()
+        cursor = connection.cursor(dictionary=True)
+
+        settle_expired_holds(connection, cursor, book_id)
+        # Lock the book so a concurrent return either sees this hold or has already made a copy available
+        cursor.execute("SELECT available_copies FROM books WHERE book_id = %s FOR UPDATE", (book_id,))
         book = cursor.fetchone()
         if not book:
-            logger.warning(f"Return confirm failed: Book {book_id} not found")
+            logger.warning(f"Place hold failed: Book {book_id} not found")
             return jsonify({"status": "error", "message": "Book not found"}), 404
+        if book['available_copies'] > 0:
+            logger.warning(f"Place hold failed: Book {book_id} is available")
+            return jsonify({"status": "error", "message": "Book is available, request a borrow instead"}), 400
+
+        cursor.execute(
+            "SELECT hold_id FROM book_holds WHERE book_id = %s AND user_id = %s AND status IN ('waiting', 'ready')",
+            (book_id, identity)
+        )
+        if cursor.fetchone():
+            logger.warning(f"Place hold failed: User {identity} already holds book {book_id}")
+            return jsonify({"status": "error", "message": "You already have a hold on this book"}), 400
+
+        cursor.execute(
+            "INSERT INTO book_holds (book_id, user_id, created_at, status) VALUES (%s, %s, %s, %s)",
+            (book_id, identity, datetime.now(), 'waiting')
+        )
+        hold_id = cursor.lastrowid
+        position = hold_position(cursor, book_id, hold_id)
+        connection.commit()
+        router.note_write(identity)
+        logger.info(f"Hold placed: User {identity}, Book {book_id}, Position: {position}")
+        return jsonify({"status": "success", "message": "Hold placed", "hold_id": hold_id, "position": position}), 201
+    except Error as e:
+        logger.error(f"Database error placing hold: {e}")
+        return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
+    finally:
+        if 'connection' in locals() and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+@app.route('/api/holds/<int:book_id>', methods=['GET'])
+@jwt_required()
+def get_hold(book_id):
+    identity = get_jwt_identity()
+    claims = get_jwt()
+    if claims['user_type'] != 'reader':
+        logger.warning(f"Fetch hold failed: Reader access required for user {identity}")
+        return jsonify({"status": "error", "message": "Reader access required"}), 403
 
-        return_date = datetime.now()
-        fine = calculate_fine(transaction['borrow_date'], transaction['due_date'], return_date, 'returned', transaction['fine_paid'])
+    try:
+        connection = get_connection(read_only=True, user_id=identity)
+        cursor = connection.cursor(dictionary=True)
 
         cursor.execute(
-            "UPDATE books SET available_copies = available_copies + 1 WHERE book_id = %s",
-            (book_id,)
+            "SELECT * FROM book_holds WHERE book_id = %s AND user_id = %s AND status IN ('waiting', 'ready')",
+            (book_id, identity)
         )
+        hold = cursor.fetchone()
+        if not hold:
+            logger.warning(f"Fetch hold failed: No active hold for user {identity}, book {book_id}")
+            return jsonify({"status": "error", "message": "No active hold found"}), 404
+
+        # A ready hold has a copy waiting at the desk, so nobody is ahead of it
+        position = 0 if hold['status'] == 'ready' else hold_position(cursor, book_id, hold['hold_id'])
+        return jsonify({
+            "status": "success",
+            "hold": {
+                "hold_id": hold['hold_id'],
+                "book_id": hold['book_id'],
+                "hold_status": hold['status'],
+                "created_at": hold['created_at'],
+                "ready_at": hold['ready_at'],
+                "pickup_by": hold['ready_at'] + timedelta(days=circulation.HOLD_PICKUP_DAYS) if hold['ready_at'] else None,
+                "position": position
+            }
+        }), 200
+    except Error as e:
+        logger.error(f"Database error fetching hold: {e}")
+        return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
+    finally:
+        if 'connection' in locals() and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+@app.route('/api/holds/<int:book_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_hold(book_id):
+    identity = get_jwt_identity()
+    claims = get_jwt()
+    if claims['user_type'] != 'reader':
+        logger.warning(f"Cancel hold failed: Reader access required for user {identity}")
+        return jsonify({"status": "error", "message": "Reader access required"}), 403
+
+    try:
+        connection = get_connection()
+        cursor = connection.cursor(dictionary=True)
+
+        settle_expired_holds(connection, cursor, book_id)
+        cursor.execute("SELECT book_id FROM books WHERE book_id = %s FOR UPDATE", (book_id,))
+        cursor.fetchone()
         cursor.execute(
-            "UPDATE borrow_transactions SET status = 'returned', return_date = %s, fine = %s WHERE id = %s",
-            (return_date, fine, transaction['id'])
+            "SELECT hold_id, status FROM book_holds WHERE book_id = %s AND user_id = %s AND status IN ('waiting', 'ready') FOR UPDATE",
+            (book_id, identity)
         )
+        hold = cursor.fetchone()
+        if not hold:
+            logger.warning(f"Cancel hold failed: No active hold for user {identity}, book {book_id}")
+            return jsonify({"status": "error", "message": "No active hold found"}), 404
+
+        cursor.execute("UPDATE book_holds SET status = 'cancelled' WHERE hold_id = %s", (hold['hold_id'],))
+        reserved_for = None
+        if hold['status'] == 'ready':
+            # The copy set aside for this reader moves on to the next hold
+            reserved_for = dispatch_copy(cursor, book_id)
+            bump_data_version(cursor, 'books')
         connection.commit()
-        logger.info(f"Return confirmed: User {user_id}, Book {book_id}, Fine: ${fine}")
-        return jsonify({"status": "success", "message": "Return confirmed", "fine": fine}), 200
+        router.note_write(identity, reserved_for)
+        logger.info(f"Hold cancelled: User {identity}, Book {book_id}")
+        return jsonify({"status": "success", "message": "Hold cancelled"}), 200
     except Error as e:
-        logger.error(f"Database error confirming return: {e}")
+        logger.error(f"Database error cancelling hold: {e}")
+        return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
+    finally:
+        if 'connection' in locals() and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+@app.route('/api/admin/holds/expire', methods=['POST'])
+@jwt_required()
+def expire_holds():
+    identity = get_jwt_identity()
+    claims = get_jwt()
+    if claims['user_type'] != 'admin':
+        logger.warning(f"Expire holds failed: Admin access required for user {identity}")
+        return jsonify({"status": "error", "message": "Admin access required"}), 403
+
+    try:
+        connection = get_connection()
+        cursor = connection.cursor(dictionary=True)
+
+        # Borrows, returns and hold changes expire a book's holds as they go; this catches books nobody touched
+        cutoff = datetime.now() - timedelta(days=circulation.HOLD_PICKUP_DAYS)
+        cursor.execute("SELECT DISTINCT book_id FROM book_holds WHERE status = 'ready' AND ready_at < %s", (cutoff,))
+        book_ids = [row['book_id'] for row in cursor.fetchall()]
+        connection.commit()
+
+        expired = 0
+        for book_id in book_ids:
+            # One short transaction per book
+            book_expired, readied = circulation.run(cursor, circulation.expire_holds(book_id, datetime.now()))
+            connection.commit()
+            router.note_write(*readied)
+            expired += book_expired
+        logger.info(f"Expired {expired} uncollected holds on {len(book_ids)} books")
+        return jsonify({"status": "success", "expired": expired}), 200
+    except Error as e:
+        logger.error(f"Database error expiring holds: {e}")
         return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
     finally:
         if 'connection' in locals() and connection.is_connected():
@@ -700,6 +1242,7 @@ def confirm_return():
 
 @app.route('/api/transactions', methods=['GET'])
 @jwt_required()
+@versioned('transactions', time_bucket=FINE_ETAG_BUCKET_SECONDS)
 def get_transactions():
     identity = get_jwt_identity()
     claims = get_jwt()
@@ -708,32 +1251,14 @@ def get_transactions():
         return jsonify({"status": "error", "message": "Admin access required"}), 403
 
     try:
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
 
-        cursor.execute("SELECT * FROM borrow_transactions")
-        transactions = cursor.fetchall()
-
-        for transaction in transactions:
-            fine = calculate_fine(
-                transaction['borrow_date'],
-                transaction['due_date'],
-                transaction['return_date'],
-                transaction['status'],
-                transaction['fine_paid']
-            )
-            if fine != float(transaction['fine']):
-                cursor.execute(
-                    "UPDATE borrow_transactions SET fine = %s WHERE id = %s",
-                    (fine, transaction['id'])
-                )
-            transaction['fine'] = fine
-            transaction['fine_paid'] = bool(transaction['fine_paid'])
-            transaction['payment_status'] = transaction['payment_status'] if transaction['payment_status'] else None
+        transactions, _ = circulation.run(cursor, circulation.transaction_history())
 
         connection.commit()
         logger.info(f"Fetched {len(transactions)} transactions for admin {identity}")
-        return jsonify({"status": "success", "transactions": transactions}), 200
+        return jsonify({"status": "success", "transactions": to_columns(transactions) if wants_columns() else transactions}), 200
     except Error as e:
         logger.error(f"Database error fetching transactions: {e}")
         return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
@@ -744,6 +1269,7 @@ def get_transactions():
 
 @app.route('/api/user/transactions', methods=['GET'])
 @jwt_required()
+@versioned('transactions', time_bucket=FINE_ETAG_BUCKET_SECONDS)
 def get_user_transactions():
     identity = get_jwt_identity()
     claims = get_jwt()
@@ -752,35 +1278,18 @@ def get_user_transactions():
         return jsonify({"status": "error", "message": "Reader access required"}), 403
 
     try:
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
 
-        cursor.execute("SELECT * FROM borrow_transactions WHERE user_id = %s", (identity,))
-        transactions = cursor.fetchall()
-
-        total_fine = 0.0
-        for transaction in transactions:
-            fine = calculate_fine(
-                transaction['borrow_date'],
-                transaction['due_date'],
-                transaction['return_date'],
-                transaction['status'],
-                transaction['fine_paid']
-            )
-            if fine != float(transaction['fine']):
-                cursor.execute(
-                    "UPDATE borrow_transactions SET fine = %s WHERE id = %s",
-                    (fine, transaction['id'])
-                )
-            transaction['fine'] = fine
-            if not transaction['fine_paid'] and transaction['payment_status'] != 'pending':
-                total_fine += fine
-            transaction['fine_paid'] = bool(transaction['fine_paid'])
-            transaction['payment_status'] = transaction['payment_status'] if transaction['payment_status'] else None
+        transactions, total_fine = circulation.run(cursor, circulation.transaction_history(identity))
 
         connection.commit()
         logger.info(f"Fetched {len(transactions)} transactions for user {identity}, Total Fine: ${total_fine}")
-        return jsonify({"status": "success", "transactions": transactions, "total_fine": total_fine}), 200
+        return jsonify({
+            "status": "success",
+            "transactions": to_columns(transactions) if wants_columns() else transactions,
+            "total_fine": total_fine
+        }), 200
     except Error as e:
         logger.error(f"Database error fetching user transactions: {e}")
         return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
@@ -799,7 +1308,7 @@ def request_fine_payment():
         return jsonify({"status": "error", "message": "Reader access required"}), 403
 
     try:
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
 
         cursor.execute(
@@ -831,6 +1340,7 @@ def request_fine_payment():
             "UPDATE borrow_transactions SET payment_status = 'pending' WHERE user_id = %s AND fine > 0 AND fine_paid = FALSE AND (payment_status IS NULL OR payment_status != 'pending')",
             (identity,)
         )
+        bump_data_version(cursor, 'transactions')
         connection.commit()
 
         logger.info(f"User {identity} requested fine payment: Total ${total_fine}")
@@ -861,7 +1371,7 @@ def admin_pay_fine():
             logger.warning("Admin pay fine failed: Missing user_id")
             return jsonify({"status": "error", "message": "Missing user_id"}), 400
 
-        connection = mysql.connector.connect(**db_config)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
 
         cursor.execute(
@@ -878,6 +1388,7 @@ def admin_pay_fine():
 
         new_status = 'approved' if approve else 'rejected'
         if approve:
+            cursor.execute(*analytics.record_fine_payments(datetime.now().date(), user_id))
             cursor.execute(
                 "UPDATE borrow_transactions SET fine_paid = TRUE, payment_status = %s WHERE user_id = %s AND fine > 0 AND fine_paid = FALSE AND payment_status = 'pending'",
                 (new_status, user_id)
@@ -888,6 +1399,7 @@ def admin_pay_fine():
                 (new_status, user_id)
             )
 
+        bump_data_version(cursor, 'transactions')
         connection.commit()
         action = "approved" if approve else "rejected"
         logger.info(f"Admin {identity} {action} fine payment for user {user_id}: Total ${total_fine}")
@@ -900,5 +1412,191 @@ def admin_pay_fine():
             cursor.close()
             connection.close()
 
+ANALYTICS_MAX_DAYS = 366
+ANALYTICS_MAX_LIMIT = 100
+
+def analytics_window():
+    days = request.args.get('days', '30')
+    limit = request.args.get('limit', '10')
+    if not days.isdigit() or not limit.isdigit() or not 1 <= int(days) <= ANALYTICS_MAX_DAYS or not 1 <= int(limit) <= ANALYTICS_MAX_LIMIT:
+        return None, None
+    return date.today() - timedelta(days=int(days) - 1), int(limit)
+
+@app.route('/api/analytics/top-books', methods=['GET'])
+@jwt_required()
+@versioned('transactions', time_bucket=FINE_ETAG_BUCKET_SECONDS, read_only=True)
+def get_top_books():
+    identity = get_jwt_identity()
+    claims = get_jwt()
+    if claims['user_type'] != 'admin':
+        logger.warning(f"Fetch top books failed: Admin access required for user {identity}")
+        return jsonify({"status": "error", "message": "Admin access required"}), 403
+
+    since, limit = analytics_window()
+    if since is None:
+        logger.warning("Fetch top books failed: Invalid days or limit")
+        return jsonify({"status": "error", "message": f"days must be 1-{ANALYTICS_MAX_DAYS} and limit 1-{ANALYTICS_MAX_LIMIT}"}), 400
+
+    try:
+        connection = get_connection(read_only=True, user_id=identity)
+        cursor = connection.cursor(dictionary=True)
+
+        cursor.execute(
+            "SELECT top.book_id, b.title, b.author, top.category, top.borrows FROM ("
+            "    SELECT book_id, MAX(category) AS category, SUM(borrows) AS borrows FROM circulation_daily"
+            "    WHERE day >= %s GROUP BY book_id ORDER BY borrows DESC LIMIT %s"
+            ") AS top LEFT JOIN books b ON b.book_id = top.book_id ORDER BY top.borrows DESC",
+            (since, limit)
+        )
+        books = cursor.fetchall()
+        for book in books:
+            book['borrows'] = int(book['borrows'])
+        return jsonify({"status": "success", "since": since.isoformat(), "books": books}), 200
+    except Error as e:
+        logger.error(f"Database error fetching top books: {e}")
+        return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
+    finally:
+        if 'connection' in locals() and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+@app.route('/api/analytics/top-categories', methods=['GET'])
+@jwt_required()
+@versioned('transactions', time_bucket=FINE_ETAG_BUCKET_SECONDS, read_only=True)
+def get_top_categories():
+    identity = get_jwt_identity()
+    claims = get_jwt()
+    if claims['user_type'] != 'admin':
+        logger.warning(f"Fetch top categories failed: Admin access required for user {identity}")
+        return jsonify({"status": "error", "message": "Admin access required"}), 403
+
+    since, limit = analytics_window()
+    if since is None:
+        logger.warning("Fetch top categories failed: Invalid days or limit")
+        return jsonify({"status": "error", "message": f"days must be 1-{ANALYTICS_MAX_DAYS} and limit 1-{ANALYTICS_MAX_LIMIT}"}), 400
+
+    try:
+        connection = get_connection(read_only=True, user_id=identity)
+        cursor = connection.cursor(dictionary=True)
+
+        cursor.execute(
+            "SELECT category, SUM(borrows) AS borrows FROM circulation_daily WHERE day >= %s "
+            "GROUP BY category ORDER BY borrows DESC LIMIT %s",
+            (since, limit)
+        )
+        categories = cursor.fetchall()
+        for category in categories:
+            category['borrows'] = int(category['borrows'])
+        return jsonify({"status": "success", "since": since.isoformat(), "categories": categories}), 200
+    except Error as e:
+        logger.error(f"Database error fetching top categories: {e}")
+        return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
+    finally:
+        if 'connection' in locals() and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+@app.route('/api/analytics/timeseries', methods=['GET'])
+@jwt_required()
+@versioned('transactions', time_bucket=FINE_ETAG_BUCKET_SECONDS, read_only=True)
+def get_circulation_timeseries():
+    identity = get_jwt_identity()
+    claims = get_jwt()
+    if claims['user_type'] != 'admin':
+        logger.warning(f"Fetch circulation timeseries failed: Admin access required for user {identity}")
+        return jsonify({"status": "error", "message": "Admin access required"}), 403
+
+    since, _ = analytics_window()
+    if since is None:
+        logger.warning("Fetch circulation timeseries failed: Invalid days")
+        return jsonify({"status": "error", "message": f"days must be 1-{ANALYTICS_MAX_DAYS}"}), 400
+
+    try:
+        category = request.args.get('category', '')
+
+        connection = get_connection(read_only=True, user_id=identity)
+        cursor = connection.cursor(dictionary=True)
+
+        sql = (
+            "SELECT day, SUM(borrows) AS borrows, SUM(returns) AS returns, SUM(overdue_returns) AS overdue_returns,"
+            " SUM(fines_collected) AS fines_collected FROM circulation_daily WHERE day >= %s"
+        )
+        params = [since]
+        if category:
+            sql += " AND category = %s"
+            params.append(category)
+        cursor.execute(sql + " GROUP BY day", params)
+        rows = {row['day']: row for row in cursor.fetchall()}
+
+        # Days without activity have no rollup rows; report them as zeros
+        series = []
+        day = since
+        while day <= date.today():
+            row = rows.get(day, {})
+            returns = int(row.get('returns') or 0)
+            overdue_returns = int(row.get('overdue_returns') or 0)
+            series.append({
+                "day": day.isoformat(),
+                "borrows": int(row.get('borrows') or 0),
+                "returns": returns,
+                "overdue_returns": overdue_returns,
+                "overdue_rate": round(overdue_returns / returns, 4) if returns else 0.0,
+                "fines_collected": float(row.get('fines_collected') or 0)
+            })
+            day += timedelta(days=1)
+        return jsonify({"status": "success", "category": category or None, "series": series}), 200
+    except Error as e:
+        logger.error(f"Database error fetching circulation timeseries: {e}")
+        return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
+    finally:
+        if 'connection' in locals() and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+@app.route('/api/analytics/utilization', methods=['GET'])
+@jwt_required()
+@versioned('books', read_only=True)
+def get_utilization():
+    identity = get_jwt_identity()
+    claims = get_jwt()
+    if claims['user_type'] != 'admin':
+        logger.warning(f"Fetch utilization failed: Admin access required for user {identity}")
+        return jsonify({"status": "error", "message": "Admin access required"}), 403
+
+    try:
+        connection = get_connection(read_only=True, user_id=identity)
+        cursor = connection.cursor(dictionary=True)
+
+        cursor.execute(
+            "SELECT category, SUM(total_copies) AS total_copies, SUM(total_copies - available_copies) AS copies_out "
+            "FROM books GROUP BY category ORDER BY category"
+        )
+        categories = cursor.fetchall()
+        total_copies = 0
+        copies_out = 0
+        for category in categories:
+            category['total_copies'] = int(category['total_copies'])
+            category['copies_out'] = int(category['copies_out'])
+            category['utilization'] = round(category['copies_out'] / category['total_copies'], 4) if category['total_copies'] else 0.0
+            total_copies += category['total_copies']
+            copies_out += category['copies_out']
+        return jsonify({
+            "status": "success",
+            "total_copies": total_copies,
+            "copies_out": copies_out,
+            "utilization": round(copies_out / total_copies, 4) if total_copies else 0.0,
+            "categories": categories
+        }), 200
+    except Error as e:
+        logger.error(f"Database error fetching utilization: {e}")
+        return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
+    finally:
+        if 'connection' in locals() and connection.is_connected():
+            cursor.close()
+            connection.close()
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # The debug reloader runs this block twice; only the serving child should schedule jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_jobs()
+    app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', '5000')))
\ No newline at end of file
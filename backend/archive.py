@@ -0,0 +1,130 @@
+"""Moves settled history out of borrow_transactions.
+
+A loan is archived once it was returned more than the horizon ago and owes nothing: its fine is
+zero or paid and no payment request is pending. Rows move in small batches, each in its own short
+transaction, so circulation queries on borrow_transactions are never blocked for long.
+
+    python archive.py --horizon-days 180 --batch-size 1000
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from mysql.connector import Error
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZON_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_PAUSE_SECONDS = 0.05
+
+# Returned before the cutoff (the first parameter) and owing nothing
+SETTLED_WHERE = (
+    "status = 'returned' AND return_date < %s AND (fine = 0 OR fine_paid = TRUE) "
+    "AND (payment_status IS NULL OR payment_status != 'pending')"
+)
+
+COLUMNS = "id, user_id, book_id, borrow_date, due_date, return_date, status, fine, fine_paid, payment_status"
+
+# History endpoints append these rows to the live ones; they are final, so fines are not refreshed
+ARCHIVED_HISTORY_SQL = f"SELECT {COLUMNS} FROM borrow_transactions_archive"
+
+
+def merge_history(live, archived):
+    # Archived loans owe nothing, so they are shown the way calculate_fine would show them
+    for transaction in archived:
+        transaction['fine'] = 0.0 if transaction['fine_paid'] else float(transaction['fine'])
+        transaction['fine_paid'] = bool(transaction['fine_paid'])
+    return sorted(list(archived) + list(live), key=lambda transaction: transaction['id'])
+
+
+def archive_batch(connection, cutoff, batch_size, after_id=0):
+    """Archive up to ``batch_size`` settled loans with ids above ``after_id``; returns ``(moved, last_id)``,
+    where last_id is None once no candidates are left."""
+    cursor = connection.cursor()
+    try:
+        # Candidates come from a plain consistent read, which takes no locks. A locking read here would lock
+        # every index record it scanned, live loans and gaps included, and stall borrows and returns.
+        cursor.execute(
+            f"SELECT id FROM borrow_transactions WHERE {SETTLED_WHERE} AND id > %s ORDER BY id LIMIT %s",
+            (cutoff, after_id, batch_size)
+        )
+        candidates = [row[0] for row in cursor.fetchall()]
+        if not candidates:
+            connection.rollback()
+            return 0, None
+        # Only the candidate rows are locked, by primary key, and re-checked in case they changed meanwhile
+        placeholders = ', '.join(['%s'] * len(candidates))
+        cursor.execute(
+            f"SELECT id FROM borrow_transactions WHERE id IN ({placeholders}) AND {SETTLED_WHERE} FOR UPDATE",
+            (*candidates, cutoff)
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            connection.rollback()
+            return 0, candidates[-1]
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(
+            f"INSERT INTO borrow_transactions_archive ({COLUMNS}, archived_at) "
+            f"SELECT {COLUMNS}, %s FROM borrow_transactions WHERE id IN ({placeholders})",
+            (datetime.now(), *ids)
+        )
+        cursor.execute(f"DELETE FROM borrow_transactions WHERE id IN ({placeholders})", tuple(ids))
+        cursor.execute(
+            "INSERT INTO data_versions (name, version) VALUES ('transactions', 1) ON DUPLICATE KEY UPDATE version = version + 1"
+        )
+        connection.commit()
+        return len(ids), candidates[-1]
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def archive_transactions(connection, horizon_days=DEFAULT_HORIZON_DAYS, batch_size=DEFAULT_BATCH_SIZE,
+                         pause_seconds=DEFAULT_PAUSE_SECONDS):
+    cutoff = datetime.now() - timedelta(days=horizon_days)
+    started = time.perf_counter()
+    archived = 0
+    batches = 0
+    last_id = 0
+    while True:
+        moved, last_id = archive_batch(connection, cutoff, batch_size, last_id)
+        if last_id is None:
+            break
+        archived += moved
+        batches += 1
+        # Give circulation traffic room between batches
+        time.sleep(pause_seconds)
+    stats = {"archived": archived, "batches": batches, "cutoff": cutoff.isoformat(), "seconds": round(time.perf_counter() - started, 3)}
+    logger.info(f"Archived {archived} transactions returned before {cutoff} in {batches} batches")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive settled borrow transactions.")
+    parser.add_argument('--horizon-days', type=int, default=DEFAULT_HORIZON_DAYS,
+                        help="Only archive loans returned more than this many days ago")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=DEFAULT_PAUSE_SECONDS, help="Seconds to sleep between batches")
+    args = parser.parse_args()
+
+    from app import get_connection
+
+    connection = get_connection()
+    try:
+        stats = archive_transactions(connection, args.horizon_days, args.batch_size, args.pause)
+    except Error as e:
+        logger.error(f"Database error archiving transactions: {e}")
+        raise SystemExit(1)
+    finally:
+        connection.close()
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,520 @@
+"""ASGI entry point: the circulation hot paths run natively async on an aiomysql pool,
+every other route is served by the Flask app through a WSGI adapter.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from io import BytesIO
+from urllib.parse import parse_qs
+
+import aiomysql
+from aiomysql import Error
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, PyJWTError
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+from app import (
+    app, db_config, replica_configs, router, rate_limiter, build_etag, matching_etag, compress_body, to_columns,
+    start_background_jobs, redis_client, user_cache, FINE_ETAG_BUCKET_SECONDS
+)
+from circulation import run_async
+from limits import AdmissionController
+import circulation
+
+logger = logging.getLogger(__name__)
+
+# Pools connect on demand, so a worker boots while MySQL is unreachable and /api/health/ready reports it
+ASYNC_POOL_MIN_SIZE = 0
+ASYNC_POOL_MAX_SIZE = 20
+ASYNC_POOL_RECYCLE_SECONDS = 3600
+# Async requests beyond the pool size wait for a connection; past this many in flight they are shed instead
+ASYNC_MAX_IN_FLIGHT = int(os.environ.get('ASYNC_MAX_IN_FLIGHT', str(ASYNC_POOL_MAX_SIZE * 4)))
+
+# Threads per process serving the Flask routes; gunicorn.conf.py sizes DB_POOL_SIZE from the same variable
+WSGI_THREADS = int(os.environ.get('WORKER_THREADS', '4'))
+
+admission = AdmissionController('asgi', ASYNC_MAX_IN_FLIGHT)
+
+
+def pool_options(config):
+    options = {
+        'host': config['host'],
+        'user': config['user'],
+        'password': config['password'],
+        'db': config['database'],
+        # Pooled connections must not sit in an open transaction; writes call begin() explicitly
+        'autocommit': True,
+        'minsize': ASYNC_POOL_MIN_SIZE,
+        'maxsize': ASYNC_POOL_MAX_SIZE,
+        'pool_recycle': ASYNC_POOL_RECYCLE_SECONDS
+    }
+    if 'port' in config:
+        options['port'] = config['port']
+    return options
+
+
+async def shared_store(call, *args):
+    # Rate limit and recent-writer checks are blocking Redis round trips when Redis is configured;
+    # run them on the default executor so one slow reply does not stall every request on the loop
+    if redis_client is None:
+        return call(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, call, *args)
+
+
+class AsyncPools:
+    """One aiomysql pool per server, created on first use."""
+
+    def __init__(self):
+        self.pools = {}
+        self._lock = asyncio.Lock()
+
+    async def pool(self, name, config):
+        pool = self.pools.get(name)
+        if pool is None:
+            async with self._lock:
+                pool = self.pools.get(name)
+                if pool is None:
+                    pool = await aiomysql.create_pool(**pool_options(config))
+                    self.pools[name] = pool
+        return pool
+
+    async def close(self):
+        pools, self.pools = list(self.pools.values()), {}
+        for pool in pools:
+            pool.close()
+            await pool.wait_closed()
+
+    @asynccontextmanager
+    async def connection(self, read_only=False, user_id=None):
+        # Same routing rules as ReplicaRouter.connect, over pools instead of fresh connections. A replica that
+        # failed is left out of router.candidates() for REPLICA_RETRY_SECONDS and then tried again.
+        if read_only and replica_configs and not await shared_store(router.wrote_recently, user_id):
+            for index in router.candidates():
+                try:
+                    pool = await self.pool(f'replica-{index}', replica_configs[index])
+                    connection = await pool.acquire()
+                except Error as e:
+                    router.mark_down(index, e)
+                    continue
+                router.lease(index)
+                try:
+                    yield connection
+                finally:
+                    pool.release(connection)
+                    router.release(index)
+                return
+        pool = await self.pool('primary', db_config)
+        connection = await pool.acquire()
+        try:
+            yield connection
+        finally:
+            pool.release(connection)
+
+
+pools = AsyncPools()
+
+
+class AsyncRequest:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope['query_string'].decode('latin-1')
+        self.args = {key: values[0] for key, values in parse_qs(self.query_string).items()}
+        self.headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        self.client = scope['client'][0] if scope.get('client') else None
+        self.body = body
+        self.identity = None
+        self.claims = None
+
+    @property
+    def full_path(self):
+        return f"{self.path}?{self.query_string}"
+
+    def get_json(self):
+        return app.json.loads(self.body) if self.body else None
+
+
+def authenticate(request):
+    # Same tokens and error responses as @jwt_required()
+    header = request.headers.get('authorization', '')
+    if not header.startswith('Bearer '):
+        return {"msg": "Missing Authorization Header"}, 401
+    try:
+        with app.app_context():
+            claims = decode_token(header[len('Bearer '):])
+    except ExpiredSignatureError:
+        return {"msg": "Token has expired"}, 401
+    except (PyJWTError, JWTExtendedException) as e:
+        return {"msg": str(e)}, 422
+    if claims.get('type') != 'access':
+        return {"msg": "Only non-refresh tokens are allowed"}, 422
+    request.claims = claims
+    request.identity = claims['sub']
+    return None
+
+
+async def get_data_versions(connection, names):
+    try:
+        async with connection.cursor() as cursor:
+            return await run_async(cursor, circulation.data_versions(names))
+    except Error as e:
+        logger.warning(f"Could not read data versions {names}: {e}")
+        return None
+
+
+async def get_books(request, connection):
+    try:
+        query = request.args.get('query', '')
+        category = request.args.get('category', '')
+        columnar = request.args.get('format') == 'columns'
+
+        sql = "SELECT * FROM books WHERE 1=1"
+        params = []
+        if query:
+            sql += " AND (title LIKE %s OR author LIKE %s)"
+            params.extend([f"%{query}%", f"%{query}%"])
+        if category:
+            sql += " AND category = %s"
+            params.append(category)
+
+        async with connection.cursor(aiomysql.Cursor if columnar else aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, params)
+            books = await cursor.fetchall()
+            columns = [column[0] for column in cursor.description]
+        logger.info(f"Fetched {len(books)} books for query: {query}, category: {category}")
+        if columnar:
+            return {"status": "success", "books": {"columns": columns, "rows": books}}, 200
+        return {"status": "success", "books": books}, 200
+    except Error as e:
+        logger.error(f"Database error fetching books: {e}")
+        return {"status": "error", "message": f"Database error: {e}"}, 500
+
+
+async def get_transactions(request, connection):
+    if request.claims['user_type'] != 'admin':
+        logger.warning(f"Fetch transactions failed: Admin access required for user {request.identity}")
+        return {"status": "error", "message": "Admin access required"}, 403
+
+    try:
+        await connection.begin()
+        async with connection.cursor(aiomysql.DictCursor) as cursor:
+            transactions, _ = await run_async(cursor, circulation.transaction_history())
+        await connection.commit()
+        logger.info(f"Fetched {len(transactions)} transactions for admin {request.identity}")
+        columnar = request.args.get('format') == 'columns'
+        return {"status": "success", "transactions": to_columns(transactions) if columnar else transactions}, 200
+    except Error as e:
+        await connection.rollback()
+        logger.error(f"Database error fetching transactions: {e}")
+        return {"status": "error", "message": f"Database error: {e}"}, 500
+
+
+async def get_user_transactions(request, connection):
+    if request.claims['user_type'] != 'reader':
+        logger.warning(f"Fetch user transactions failed: Reader access required for user {request.identity}")
+        return {"status": "error", "message": "Reader access required"}, 403
+
+    try:
+        await connection.begin()
+        async with connection.cursor(aiomysql.DictCursor) as cursor:
+            transactions, total_fine = await run_async(cursor, circulation.transaction_history(request.identity))
+        await connection.commit()
+        logger.info(f"Fetched {len(transactions)} transactions for user {request.identity}, Total Fine: ${total_fine}")
+        columnar = request.args.get('format') == 'columns'
+        return {
+            "status": "success",
+            "transactions": to_columns(transactions) if columnar else transactions,
+            "total_fine": total_fine
+        }, 200
+    except Error as e:
+        await connection.rollback()
+        logger.error(f"Database error fetching user transactions: {e}")
+        return {"status": "error", "message": f"Database error: {e}"}, 500
+
+
+async def confirm_borrow(request, connection):
+    identity = request.identity
+    if request.claims['user_type'] != 'admin':
+        logger.warning(f"Borrow confirm failed: Admin access required for user {identity}")
+        return {"status": "error", "message": "Admin access required"}, 403
+
+    data = request.get_json() or {}
+    user_id = data.get('user_id')
+    book_id = data.get('book_id')
+    action = data.get('action')
+
+    if not all([user_id, book_id, action]) or action != 'borrow':
+        logger.warning("Borrow confirm failed: Invalid request data")
+        return {"status": "error", "message": "Invalid request data"}, 400
+
+    try:
+        user_id = int(user_id)
+    except ValueError:
+        logger.warning(f"Borrow confirm failed: Invalid user_id format: {user_id}")
+        return {"status": "error", "message": "Invalid user_id format"}, 400
+
+    try:
+        await connection.begin()
+        async with connection.cursor(aiomysql.DictCursor) as cursor:
+            if not await run_async(cursor, circulation.lookup(user_cache, circulation.USER_LOOKUP_SQL, user_id)):
+                logger.warning(f"Borrow confirm failed: User {user_id} not found")
+                return {"status": "error", "message": "User not found"}, 404
+
+            due_date, readied = await run_async(cursor, circulation.confirm_borrow(user_id, book_id, datetime.now()))
+            if due_date is None:
+                logger.warning(f"Borrow confirm failed: Book {book_id} not available")
+                return {"status": "error", "message": "Book not available"}, 404
+        await connection.commit()
+        await shared_store(router.note_write, identity, user_id, *readied)
+        logger.info(f"Borrow confirmed: User {user_id}, Book {book_id}, Due Date: {due_date}")
+        return {"status": "success", "message": "Borrow confirmed"}, 200
+    except Error as e:
+        await connection.rollback()
+        logger.error(f"Database error confirming borrow: {e}")
+        return {"status": "error", "message": f"Database error: {e}"}, 500
+
+
+async def confirm_return(request, connection):
+    identity = request.identity
+    if request.claims['user_type'] != 'admin':
+        logger.warning(f"Return confirm failed: Admin access required for user {identity}")
+        return {"status": "error", "message": "Admin access required"}, 403
+
+    data = request.get_json() or {}
+    user_id = data.get('user_id')
+    book_id = data.get('book_id')
+    action = data.get('action')
+
+    if not all([user_id, book_id, action]) or action != 'return':
+        logger.warning("Return confirm failed: Invalid request data")
+        return {"status": "error", "message": "Invalid request data"}, 400
+
+    try:
+        user_id = int(user_id)
+    except ValueError:
+        logger.warning(f"Return confirm failed: Invalid user_id format: {user_id}")
+        return {"status": "error", "message": "Invalid user_id format"}, 400
+
+    try:
+        await connection.begin()
+        async with connection.cursor(aiomysql.DictCursor) as cursor:
+            error, fine, reserved_for, readied = await run_async(
+                cursor, circulation.confirm_return(user_id, book_id, datetime.now())
+            )
+            if error:
+                logger.warning(f"Return confirm failed: {error} for user {user_id}, book {book_id}")
+                return {"status": "error", "message": error}, 404
+        await connection.commit()
+        await shared_store(router.note_write, identity, user_id, reserved_for, *readied)
+        logger.info(f"Return confirmed: User {user_id}, Book {book_id}, Fine: ${fine}, Reserved for: {reserved_for}")
+        return {"status": "success", "message": "Return confirmed", "fine": fine, "reserved_for": reserved_for}, 200
+    except Error as e:
+        await connection.rollback()
+        logger.error(f"Database error confirming return: {e}")
+        return {"status": "error", "message": f"Database error: {e}"}, 500
+
+
+class Route:
+    def __init__(self, handler, versions=(), time_bucket=None, read_only=False):
+        self.handler = handler
+        self.versions = versions
+        self.time_bucket = time_bucket
+        self.read_only = read_only
+
+
+ROUTES = {
+    ('GET', '/api/books'): Route(get_books, versions=('books',), read_only=True),
+    ('GET', '/api/transactions'): Route(get_transactions, versions=('transactions',), time_bucket=FINE_ETAG_BUCKET_SECONDS),
+    ('GET', '/api/user/transactions'): Route(get_user_transactions, versions=('transactions',), time_bucket=FINE_ETAG_BUCKET_SECONDS),
+    ('POST', '/api/borrow/confirm'): Route(confirm_borrow),
+    ('POST', '/api/return/confirm'): Route(confirm_return),
+}
+
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f"HTTP_{key}"
+        value = value.decode('latin-1')
+        environ[key] = f"{environ[key]},{value}" if key.startswith('HTTP_') and key in environ else value
+    return environ
+
+
+class ThreadedWsgi:
+    """Serves a WSGI app to ASGI from a sized thread pool. asgiref's WsgiToAsgi runs every request
+    on one shared thread, which would serialize all the Flask routes of a process."""
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        environ = wsgi_environ(scope, await read_body(receive))
+        status, headers, body = await asyncio.get_running_loop().run_in_executor(self.executor, self.run, environ)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def run(self, environ):
+        # Responses are buffered; every Flask route returns a complete JSON body anyway
+        started = {}
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return chunks.append
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            chunks.extend(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started['status'], started['headers'], b''.join(chunks)
+
+
+class AsyncAPI:
+    def __init__(self, wsgi_app, routes):
+        self.wsgi = ThreadedWsgi(wsgi_app, WSGI_THREADS)
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        route = self.routes.get((scope['method'], scope['path']))
+        if route is None:
+            await self.wsgi(scope, receive, send)
+            return
+        await self.handle(route, AsyncRequest(scope, await read_body(receive)), send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                start_background_jobs()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await pools.close()
+                self.wsgi.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle(self, route, request, send):
+        error = authenticate(request)
+        client = f"user:{request.identity}" if request.identity else f"ip:{request.client}"
+        route_name = route.handler.__name__
+        retry_after = await shared_store(rate_limiter.check, route_name, client)
+        if retry_after:
+            logger.warning(f"Rate limited: {client} on {route_name}")
+            await respond(send, request, 429, {"status": "error", "message": "Too many requests"},
+                          headers=[(b'retry-after', str(retry_after).encode('latin-1'))])
+            return
+        if error:
+            payload, status = error
+            await respond(send, request, status, payload)
+            return
+
+        if not admission.try_enter():
+            logger.warning(f"Shedding {route_name}: {admission.in_flight} requests in flight")
+            await respond(send, request, 503, {"status": "error", "message": "Server busy, try again shortly"},
+                          headers=[(b'retry-after', b'1')])
+            return
+        try:
+            await self.dispatch(route, request, send)
+        finally:
+            admission.leave()
+
+    async def dispatch(self, route, request, send):
+        etag = None
+        try:
+            async with pools.connection(route.read_only, request.identity) as connection:
+                if route.versions:
+                    versions = await get_data_versions(connection, route.versions)
+                    if versions is not None:
+                        etag = build_etag(route.versions, versions, route.time_bucket, request.identity, request.full_path)
+                        matched = matching_etag(etag, parse_etags(request.headers.get('if-none-match')))
+                        if matched:
+                            await respond(send, request, 304, None, etag=matched)
+                            return
+                payload, status = await route.handler(request, connection)
+                # Early returns inside a transaction would otherwise make the pool discard the connection
+                if connection.get_transaction_status():
+                    await connection.rollback()
+        except Error as e:
+            logger.error(f"Database error on {request.method} {request.path}: {e}")
+            payload, status = {"status": "error", "message": f"Database error: {e}"}, 500
+        except ValueError as e:
+            payload, status = {"status": "error", "message": f"Invalid JSON body: {e}"}, 400
+        await respond(send, request, status, payload, etag=etag if status == 200 else None)
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def respond(send, request, status, payload, etag=None, headers=None):
+    headers = list(headers or [])
+    body = b''
+    if payload is not None:
+        body = app.json.dumps(payload).encode('utf-8') + b'\n'
+        headers.append((b'content-type', b'application/json'))
+    if status in (200, 304) and etag is not None:
+        headers.append((b'cache-control', b'private, no-cache'))
+    if status in (200, 304):
+        # A 304 revalidates one encoding's ETag, so caches must key it on Accept-Encoding too
+        headers.append((b'vary', b'Accept-Encoding'))
+    if status == 200:
+        body, encoding = compress_body(body, parse_accept_header(request.headers.get('accept-encoding')))
+        if encoding:
+            headers.append((b'content-encoding', encoding.encode('latin-1')))
+            if etag:
+                etag = f"{etag}-{encoding}"
+    if etag is not None:
+        headers.append((b'etag', quote_etag(etag).encode('latin-1')))
+    if 'origin' in request.headers:
+        headers.append((b'access-control-allow-origin', b'*'))
+    headers.append((b'content-length', str(len(body)).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+application = AsyncAPI(app, ROUTES)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:application', host='0.0.0.0', port=5000)
@@ -0,0 +1,66 @@
+import threading
+import time
+from collections import OrderedDict
+
+from limits import metrics
+
+
+class LRUCache:
+    """Thread-safe, size-bounded cache whose entries also expire after ``ttl_seconds``.
+
+    Each process has its own copy, so writers invalidate locally and the TTL bounds how long other
+    workers can serve a stale record. ``max_entries=0`` disables it. Only found records are cached,
+    so newly created rows need no invalidation.
+    """
+
+    def __init__(self, name, max_entries, ttl_seconds):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        if not self.max_entries:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value = entry[0]
+            else:
+                if entry:
+                    del self._entries[key]
+                self.misses += 1
+                value = None
+        metrics.incr('cache_hits' if value is not None else 'cache_misses', self.name)
+        return dict(value) if value is not None else None
+
+    def put(self, key, value):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (dict(value), time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": bool(self.max_entries),
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None
+            }
@@ -0,0 +1,217 @@
+"""Circulation logic shared by the Flask views (app.py) and the async handlers (asgi.py).
+
+Each operation is a generator that yields ``(sql, params, fetch)`` and is sent back the result of
+that statement (``fetch`` is ``'one'``, ``'all'`` or None), so the SQL and the decisions between
+statements live in one place. ``run`` drives an operation on a mysql-connector cursor and
+``run_async`` on an aiomysql one. Rows are read as dicts, so pass a dictionary cursor to
+everything except ``data_versions``, which reads plain tuples.
+
+    due_date, readied = run(cursor, confirm_borrow(user_id, book_id, datetime.now()))
+"""
+import os
+from datetime import datetime, timedelta
+
+import analytics
+import archive
+
+FINE_PER_DAY = 1.0
+BORROW_PERIOD_DAYS = 14
+# A copy set aside for a hold goes to the next reader if it is not collected within this many days
+HOLD_PICKUP_DAYS = int(os.environ.get('HOLD_PICKUP_DAYS', '3'))
+
+BOOK_LOOKUP_SQL = "SELECT book_id, title, author, isbn, category, total_copies FROM books WHERE book_id = %s"
+USER_LOOKUP_SQL = "SELECT user_id, name, email, library_card_no, user_type FROM users WHERE user_id = %s"
+
+
+def run(cursor, operation):
+    try:
+        sql, params, fetch = next(operation)
+        while True:
+            cursor.execute(sql, params)
+            result = cursor.fetchone() if fetch == 'one' else cursor.fetchall() if fetch == 'all' else None
+            sql, params, fetch = operation.send(result)
+    except StopIteration as done:
+        return done.value
+
+
+async def run_async(cursor, operation):
+    try:
+        sql, params, fetch = next(operation)
+        while True:
+            await cursor.execute(sql, params)
+            result = await cursor.fetchone() if fetch == 'one' else await cursor.fetchall() if fetch == 'all' else None
+            sql, params, fetch = operation.send(result)
+    except StopIteration as done:
+        return done.value
+
+
+def calculate_fine(borrow_date, due_date, return_date, status, fine_paid):
+    if fine_paid:
+        return 0.0
+
+    today = datetime.now()
+    due_date = datetime.strptime(due_date, '%Y-%m-%d %H:%M:%S') if isinstance(due_date, str) else due_date
+
+    if status == 'returned' and return_date:
+        return_date = datetime.strptime(return_date, '%Y-%m-%d %H:%M:%S') if isinstance(return_date, str) else return_date
+        if return_date <= due_date:
+            return 0.0
+        overdue_days = (return_date - due_date).days
+    else:
+        if today <= due_date:
+            return 0.0
+        overdue_days = (today - due_date).days
+
+    fine = overdue_days * FINE_PER_DAY
+    return round(fine, 2)
+
+
+def lookup(cache, sql, record_id):
+    # Only found records are cached, so new rows need no invalidation
+    record = cache.get(str(record_id))
+    if record is None:
+        record = yield (sql, (record_id,), 'one')
+        if record:
+            cache.put(str(record_id), record)
+    return record
+
+
+def bump_data_version(*names):
+    for name in names:
+        yield (
+            "INSERT INTO data_versions (name, version) VALUES (%s, 1) ON DUPLICATE KEY UPDATE version = version + 1",
+            (name,), None
+        )
+
+
+def data_versions(names):
+    placeholders = ', '.join(['%s'] * len(names))
+    rows = yield (f"SELECT name, version FROM data_versions WHERE name IN ({placeholders})", tuple(names), 'all')
+    versions = {row[0]: row[1] for row in rows}
+    return [versions.get(name, 0) for name in names]
+
+
+def dispatch_copy(book_id, now):
+    # A freed copy goes to the first waiting hold; only with no one waiting does it become available again.
+    # Callers must hold the lock on the book row.
+    hold = yield (
+        "SELECT hold_id, user_id FROM book_holds WHERE book_id = %s AND status = 'waiting' ORDER BY hold_id LIMIT 1 FOR UPDATE",
+        (book_id,), 'one'
+    )
+    if hold:
+        yield ("UPDATE book_holds SET status = 'ready', ready_at = %s WHERE hold_id = %s", (now, hold['hold_id']), None)
+        return hold['user_id']
+    yield ("UPDATE books SET available_copies = available_copies + 1 WHERE book_id = %s", (book_id,), None)
+    return None
+
+
+def expire_ready_holds(book_id, now):
+    # Returns how many holds expired and the readers whose holds became ready in their place, who must be
+    # passed to ReplicaRouter.note_write. Callers must hold the lock on the book row.
+    expired = yield (
+        "SELECT hold_id FROM book_holds WHERE book_id = %s AND status = 'ready' AND ready_at < %s FOR UPDATE",
+        (book_id, now - timedelta(days=HOLD_PICKUP_DAYS)), 'all'
+    )
+    readied = []
+    for hold in expired:
+        yield ("UPDATE book_holds SET status = 'expired' WHERE hold_id = %s", (hold['hold_id'],), None)
+        reserved_for = yield from dispatch_copy(book_id, now)
+        if reserved_for is not None:
+            readied.append(reserved_for)
+    return len(expired), readied
+
+
+def expire_holds(book_id, now):
+    """Expire the book's uncollected holds in a transaction of their own; for sweeps over books nobody
+    is borrowing or returning. Returns ``(expired, readied)`` like ``expire_ready_holds``."""
+    book = yield ("SELECT book_id FROM books WHERE book_id = %s FOR UPDATE", (book_id,), 'one')
+    if not book:
+        return 0, []
+    expired, readied = yield from expire_ready_holds(book_id, now)
+    if expired:
+        yield from bump_data_version('books')
+    return expired, readied
+
+
+def confirm_borrow(user_id, book_id, now):
+    """Lend the book to the user; returns ``(due_date, readied)``, where due_date is None if no copy is
+    available to them and readied lists the readers whose holds became ready meanwhile."""
+    # Lock the book row so concurrent borrows and returns of it are serialized
+    book = yield ("SELECT * FROM books WHERE book_id = %s FOR UPDATE", (book_id,), 'one')
+    if not book:
+        return None, []
+    expired, readied = yield from expire_ready_holds(book_id, now)
+    if expired:
+        book = yield ("SELECT * FROM books WHERE book_id = %s", (book_id,), 'one')
+    hold = yield (
+        "SELECT hold_id FROM book_holds WHERE book_id = %s AND user_id = %s AND status = 'ready' FOR UPDATE",
+        (book_id, user_id), 'one'
+    )
+    if not hold and book['available_copies'] <= 0:
+        return None, readied
+
+    due_date = now + timedelta(days=BORROW_PERIOD_DAYS)
+    if hold:
+        # The copy was already taken out of available_copies when it was set aside
+        yield ("UPDATE book_holds SET status = 'fulfilled' WHERE hold_id = %s", (hold['hold_id'],), None)
+    else:
+        yield ("UPDATE books SET available_copies = available_copies - 1 WHERE book_id = %s", (book_id,), None)
+    yield (
+        "INSERT INTO borrow_transactions (user_id, book_id, borrow_date, due_date, status) VALUES (%s, %s, %s, %s, %s)",
+        (user_id, book_id, now, due_date, 'borrowed'), None
+    )
+    yield (*analytics.record_borrow(now.date(), book_id, book['category']), None)
+    yield from bump_data_version('books', 'transactions')
+    return due_date, readied
+
+
+def confirm_return(user_id, book_id, now):
+    """Take the book back; returns ``(error, fine, reserved_for, readied)`` where error is None on success,
+    reserved_for is the reader the returned copy was set aside for and readied those of expired holds."""
+    transaction = yield (
+        "SELECT * FROM borrow_transactions WHERE user_id = %s AND book_id = %s AND status = 'borrowed'",
+        (user_id, book_id), 'one'
+    )
+    if not transaction:
+        return "No active borrow transaction found", None, None, []
+    book = yield ("SELECT * FROM books WHERE book_id = %s FOR UPDATE", (book_id,), 'one')
+    if not book:
+        return "Book not found", None, None, []
+
+    fine = calculate_fine(transaction['borrow_date'], transaction['due_date'], now, 'returned', transaction['fine_paid'])
+    _, readied = yield from expire_ready_holds(book_id, now)
+    reserved_for = yield from dispatch_copy(book_id, now)
+    yield (
+        "UPDATE borrow_transactions SET status = 'returned', return_date = %s, fine = %s WHERE id = %s",
+        (now, fine, transaction['id']), None
+    )
+    yield (*analytics.record_return(now.date(), book_id, book['category'], now > transaction['due_date']), None)
+    yield from bump_data_version('books', 'transactions')
+    return None, fine, reserved_for, readied
+
+
+def transaction_history(user_id=None):
+    """Live and archived loans, of one user or everyone, with fines brought up to date; returns
+    ``(transactions, total_fine)``. The caller commits the refreshed fines."""
+    where, params = (" WHERE user_id = %s", (user_id,)) if user_id is not None else ("", ())
+    transactions = yield (f"SELECT * FROM borrow_transactions{where}", params, 'all')
+
+    total_fine = 0.0
+    for transaction in transactions:
+        fine = calculate_fine(
+            transaction['borrow_date'],
+            transaction['due_date'],
+            transaction['return_date'],
+            transaction['status'],
+            transaction['fine_paid']
+        )
+        if fine != float(transaction['fine']):
+            yield ("UPDATE borrow_transactions SET fine = %s WHERE id = %s", (fine, transaction['id']), None)
+        transaction['fine'] = fine
+        if not transaction['fine_paid'] and transaction['payment_status'] != 'pending':
+            total_fine += fine
+        transaction['fine_paid'] = bool(transaction['fine_paid'])
+        transaction['payment_status'] = transaction['payment_status'] if transaction['payment_status'] else None
+
+    archived = yield (f"{archive.ARCHIVED_HISTORY_SQL}{where}", params, 'all')
+    return archive.merge_history(transactions, archived), total_fine
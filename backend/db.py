@@ -0,0 +1,188 @@
+import logging
+import os
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import Error
+from mysql.connector.pooling import MySQLConnectionPool
+
+logger = logging.getLogger(__name__)
+
+SELECTION_STRATEGIES = ('round_robin', 'least_loaded')
+
+
+class MemoryWriterStore:
+    """Recent writers in this process. Another worker or node does not see them, so read-your-writes only
+    holds while the user's requests land on the process that made the write."""
+
+    max_keys = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._writers = {}
+
+    def note(self, user_ids, seconds):
+        now = time.monotonic()
+        with self._lock:
+            for user_id in user_ids:
+                self._writers[user_id] = now + seconds
+            if len(self._writers) > self.max_keys:
+                self._writers = {k: until for k, until in self._writers.items() if until > now}
+
+    def recent(self, user_id):
+        with self._lock:
+            until = self._writers.get(user_id)
+        return until is not None and until > time.monotonic()
+
+
+class RedisWriterStore:
+    """Recent writers shared by every process and node through Redis keys that expire on their own."""
+
+    def __init__(self, client, prefix='campuslib:wrote:'):
+        self.prefix = prefix
+        self._client = client
+
+    def note(self, user_ids, seconds):
+        pipe = self._client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.set(self.prefix + user_id, 1, ex=seconds)
+        pipe.execute()
+
+    def recent(self, user_id):
+        return bool(self._client.exists(self.prefix + user_id))
+
+
+class ReplicaRouter:
+    """Routes read-only work to replicas and everything else to the primary.
+
+    Replicas that fail to connect are skipped for ``retry_seconds``; when no
+    replica is usable the primary serves the read. Users that wrote recently
+    (see ``note_write``) read from the primary for ``read_your_writes_seconds``
+    so they never see a replica that has not caught up with their own change.
+    ``writers`` records them; the default MemoryWriterStore only covers this
+    process, RedisWriterStore every worker and node.
+
+    With ``pool_size`` set, connections come from one pool per server. Pools
+    belong to the process that created them and are rebuilt after a fork.
+    """
+
+    def __init__(self, primary_config, replica_configs, selection='round_robin',
+                 retry_seconds=30, read_your_writes_seconds=10, pool_size=0, writers=None):
+        if selection not in SELECTION_STRATEGIES:
+            raise ValueError(f"Unknown replica selection '{selection}', expected one of {SELECTION_STRATEGIES}")
+        self.primary_config = primary_config
+        self.replica_configs = list(replica_configs)
+        self.selection = selection
+        self.retry_seconds = retry_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._lock = threading.Lock()
+        self._next = 0
+        self._in_use = [0] * len(self.replica_configs)
+        self._down_until = [0.0] * len(self.replica_configs)
+        self.writers = writers or MemoryWriterStore()
+        self.pool_size = pool_size
+        self._pools = {}
+        self._pools_pid = None
+
+    def init_pools(self):
+        """Drop pools inherited from a parent process and open this process's own."""
+        with self._lock:
+            self._pools = {}
+            self._pools_pid = os.getpid()
+        if not self.pool_size:
+            return
+        self._pool('primary', self.primary_config)
+        for index, config in enumerate(self.replica_configs):
+            try:
+                self._pool(f'replica-{index}', config)
+            except Error as e:
+                self.mark_down(index, e)
+
+    def _pool(self, name, config):
+        with self._lock:
+            if self._pools_pid != os.getpid():
+                self._pools = {}
+                self._pools_pid = os.getpid()
+            pool = self._pools.get(name)
+            if pool is None:
+                pool = MySQLConnectionPool(pool_name=f'campuslib-{name}', pool_size=self.pool_size, **config)
+                self._pools[name] = pool
+            return pool
+
+    def _open(self, name, config):
+        if not self.pool_size:
+            return mysql.connector.connect(**config)
+        return self._pool(name, config).get_connection()
+
+    def pool_status(self):
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "pools": sorted(self._pools) if self._pools_pid == os.getpid() else [],
+                "replicas_down": [i for i, until in enumerate(self._down_until) if until > time.monotonic()]
+            }
+
+    def note_write(self, *user_ids):
+        user_ids = [str(user_id) for user_id in user_ids if user_id is not None]
+        if not self.replica_configs or not user_ids:
+            return
+        try:
+            self.writers.note(user_ids, self.read_your_writes_seconds)
+        except Exception as e:
+            logger.error(f"Could not record recent writers {user_ids}: {e}")
+
+    def wrote_recently(self, user_id):
+        if user_id is None:
+            return False
+        try:
+            return self.writers.recent(str(user_id))
+        except Exception as e:
+            # Without the store we cannot tell, and the primary is never stale
+            logger.error(f"Could not check recent writes of user {user_id}, reading from primary: {e}")
+            return True
+
+    def candidates(self, preferred=None):
+        """Healthy replica indexes, the one to try first leading."""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [i for i in range(len(self.replica_configs)) if self._down_until[i] <= now]
+            if not healthy:
+                return []
+            if preferred in healthy:
+                first = preferred
+            elif self.selection == 'least_loaded':
+                first = min(healthy, key=lambda i: self._in_use[i])
+            else:
+                first = healthy[self._next % len(healthy)]
+                self._next += 1
+            return [first] + [i for i in healthy if i != first]
+
+    def connect(self, read_only=False, user_id=None, preferred=None):
+        """Return ``(connection, replica_index)``; the index is None for the primary."""
+        if read_only and self.replica_configs and not self.wrote_recently(user_id):
+            for index in self.candidates(preferred):
+                try:
+                    connection = self._open(f'replica-{index}', self.replica_configs[index])
+                except Error as e:
+                    self.mark_down(index, e)
+                    continue
+                self.lease(index)
+                return connection, index
+            logger.warning("No replica available, reading from primary")
+        return self._open('primary', self.primary_config), None
+
+    def mark_down(self, index, error):
+        logger.warning(f"Replica {index} unavailable, skipping for {self.retry_seconds}s: {error}")
+        with self._lock:
+            self._down_until[index] = time.monotonic() + self.retry_seconds
+
+    def lease(self, index):
+        with self._lock:
+            self._in_use[index] += 1
+
+    def release(self, index):
+        if index is None:
+            return
+        with self._lock:
+            self._in_use[index] = max(0, self._in_use[index] - 1)
@@ -0,0 +1,44 @@
+# Production server: gunicorn -c gunicorn.conf.py
+#
+# Configuration comes from the environment (see README). The app is imported once in the
+# master and forked into the workers; each worker then opens its own database pools.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WORKER_THREADS', '4'))
+# gthread for app:app; uvicorn.workers.UvicornWorker with APP_MODULE=asgi:application for async mode
+worker_class = os.environ.get('WORKER_CLASS', 'gthread')
+if worker_class == 'gthread':
+    # gthread that times each request's wait for a thread, so app.py can shed on MAX_QUEUE_WAIT_MS
+    worker_class = 'workers.QueueTimedThreadWorker'
+# Connections a worker holds at once (busy, queued or keep-alive); past this it stops accepting and
+# other workers or the listen backlog take them, instead of one worker queueing a thousand requests
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', '100'))
+wsgi_app = os.environ.get('APP_MODULE', 'app:app')
+
+preload_app = True
+timeout = int(os.environ.get('WORKER_TIMEOUT', '60'))
+# Workers finish in-flight requests for up to this long on reload or shutdown
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+# One pooled connection per request thread, plus headroom for health checks
+os.environ.setdefault('DB_POOL_SIZE', str(threads + 2))
+# A gthread worker runs at most `threads` requests, so an in-flight cap never sheds; queue wait does instead
+if worker_class == 'workers.QueueTimedThreadWorker':
+    os.environ.setdefault('MAX_IN_FLIGHT_REQUESTS', '0')
+
+
+def post_fork(server, worker):
+    from mysql.connector import Error
+    from app import router, start_background_jobs
+
+    try:
+        router.init_pools()
+    except Error as e:
+        # Pools are retried on the next request; /api/health/ready reports 503 meanwhile
+        server.log.warning(f"Worker {worker.pid} could not open database pools: {e}")
+    # Threads do not survive the fork, so schedulers start in each worker
+    start_background_jobs()
@@ -0,0 +1,138 @@
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Process-local counters, exposed by GET /api/metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def incr(self, name, label=None, amount=1):
+        key = f"{name}{{{label}}}" if label else name
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+
+metrics = Metrics()
+
+# Seconds the request on this thread waited for a worker thread; set by workers.QueueTimedThreadWorker
+queue_wait = threading.local()
+
+
+class MemoryBucketStore:
+    """Token buckets in this process. Idle buckets are dropped once the table gets large;
+    ``idle_seconds`` must exceed the longest refill time (burst / rate) of any budget."""
+
+    max_keys = 50000
+    idle_seconds = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry_after = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / rate
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return retry_after
+
+    def _prune(self, now):
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < self.idle_seconds
+        }
+
+
+class RedisBucketStore:
+    """Token buckets shared by every process and node through Redis."""
+
+    SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(state[1]) or burst
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + (now - updated) * rate)
+        local retry_after = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            retry_after = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+        return tostring(retry_after)
+    """
+
+    def __init__(self, client, prefix='campuslib:ratelimit:'):
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst):
+        return float(self._script(keys=[self.prefix + key], args=[rate, burst]))
+
+
+class RateLimiter:
+    def __init__(self, budgets, default_budget, store=None):
+        # budgets: route name -> (requests per second, burst) per client
+        self.budgets = budgets
+        self.default_budget = default_budget
+        self.store = store or MemoryBucketStore()
+
+    def check(self, route, client):
+        """Return 0 if the request may proceed, otherwise seconds until it would be allowed."""
+        rate, burst = self.budgets.get(route, self.default_budget)
+        try:
+            retry_after = self.store.take(f"{route}:{client}", rate, burst)
+        except Exception as e:
+            # A broken shared store must not take the API down with it
+            logger.error(f"Rate limit store failed, allowing request: {e}")
+            metrics.incr('rate_limit_store_errors')
+            return 0
+        if retry_after:
+            metrics.incr('rejected_rate_limited', route)
+            return max(1, math.ceil(retry_after))
+        return 0
+
+
+class AdmissionController:
+    """Caps requests in flight in this process; past the cap new requests are shed instead of queued."""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_enter(self):
+        with self._lock:
+            if self.limit and self.in_flight >= self.limit:
+                metrics.incr('rejected_overloaded', self.name)
+                return False
+            self.in_flight += 1
+        metrics.incr('admitted', self.name)
+        return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
@@ -0,0 +1,99 @@
+"""Hit one endpoint with many concurrent keep-alive clients and report throughput and latency.
+
+Run it unchanged against `python app.py` and `uvicorn asgi:application` to compare modes:
+
+    python loadtest.py --url http://localhost:5000/api/books --token <jwt> --concurrency 200 --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+
+async def fetch(reader, writer, request):
+    writer.write(request)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+    keep_alive = headers.get('connection', '').lower() != 'close' and 'content-length' in headers
+    return status, keep_alive
+
+
+async def client(host, port, request, remaining, latencies, errors):
+    connection = None
+    while remaining[0] > 0:
+        remaining[0] -= 1
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            status, keep_alive = await fetch(*connection, request)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors[status] = errors.get(status, 0) + 1
+        except (OSError, asyncio.IncompleteReadError) as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            keep_alive = False
+        if not keep_alive and connection is not None:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(url, token, concurrency, total):
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else '')
+    request = (
+        f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nAuthorization: Bearer {token}\r\n"
+        f"Accept-Encoding: gzip\r\n\r\n"
+    ).encode('latin-1')
+    remaining = [total]
+    latencies = []
+    errors = {}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(parts.hostname, parts.port or 80, request, remaining, latencies, errors) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "errors": errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent GET load test for the CampusLib API.")
+    parser.add_argument('--url', default='http://localhost:5000/api/books')
+    parser.add_argument('--token', required=True, help="Access token from /api/login")
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.url, args.token, args.concurrency, args.requests))))
+
+
+if __name__ == '__main__':
+    main()
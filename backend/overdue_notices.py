@@ -0,0 +1,229 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+
+from mysql.connector import Error
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_FETCH_SIZE = 1000
+PROGRESS_EVERY_USERS = 10000
+JOB_NAME = 'overdue_notices'
+# Schedulers check this often whether a run is due, so a run starts at most this late
+SCHEDULER_POLL_SECONDS = 60
+
+# Ordered by user so each borrower's loans arrive contiguously and can be grouped while streaming.
+# Benefits from an index on borrow_transactions (status, due_date).
+OVERDUE_QUERY = """
+    SELECT bt.id, bt.user_id, bt.book_id, bt.borrow_date, bt.due_date, bt.fine_paid,
+           u.name, u.email, u.library_card_no, b.title, b.author
+    FROM borrow_transactions bt
+    JOIN users u ON u.user_id = bt.user_id
+    JOIN books b ON b.book_id = bt.book_id
+    WHERE bt.status = 'borrowed' AND bt.due_date < %s
+    ORDER BY bt.user_id, bt.due_date
+"""
+
+
+class MockSender:
+    """Counts notices instead of delivering them; ``latency`` simulates a slow mail API."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def send(self, notice):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.sent += 1
+
+    def close(self):
+        pass
+
+
+class FileSender:
+    """Appends each notice as one JSON line to a local file."""
+
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def send(self, notice):
+        line = json.dumps(notice, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+def stream_overdue_rows(cursor, now, fetch_size):
+    cursor.execute(OVERDUE_QUERY, (now,))
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def build_notice(user_id, loans, calculate_fine):
+    first = loans[0]
+    items = []
+    total_fine = 0.0
+    for loan in loans:
+        fine = calculate_fine(loan['borrow_date'], loan['due_date'], None, 'borrowed', loan['fine_paid'])
+        total_fine += fine
+        items.append({
+            "transaction_id": loan['id'],
+            "book_id": loan['book_id'],
+            "title": loan['title'],
+            "author": loan['author'],
+            "due_date": loan['due_date'],
+            "fine": fine
+        })
+    return {
+        "user_id": user_id,
+        "name": first['name'],
+        "email": first['email'],
+        "library_card_no": first['library_card_no'],
+        "loans": items,
+        "total_fine": round(total_fine, 2)
+    }
+
+
+def run_overdue_notices(router, sender, calculate_fine, workers=DEFAULT_WORKERS, fetch_size=DEFAULT_FETCH_SIZE):
+    stats = {"users": 0, "loans": 0, "sent": 0, "failed": 0}
+    stats_lock = threading.Lock()
+    # At most this many notices are built but not yet sent, so memory does not grow with the result size
+    in_flight = threading.BoundedSemaphore(workers * 2)
+
+    def deliver(notice):
+        try:
+            sender.send(notice)
+            outcome = "sent"
+        except Exception as e:
+            logger.error(f"Overdue notice for user {notice['user_id']} failed: {e}")
+            outcome = "failed"
+        finally:
+            in_flight.release()
+        with stats_lock:
+            stats[outcome] += 1
+
+    started = time.perf_counter()
+    connection, replica_index = router.connect(read_only=True)
+    try:
+        # Unbuffered cursor: rows are pulled from the server as fetchmany() asks for them
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='overdue-notice') as executor:
+            for user_id, loans in groupby(stream_overdue_rows(cursor, datetime.now(), fetch_size), key=itemgetter('user_id')):
+                loans = list(loans)
+                notice = build_notice(user_id, loans, calculate_fine)
+                in_flight.acquire()
+                executor.submit(deliver, notice)
+                stats["users"] += 1
+                stats["loans"] += len(loans)
+                if stats["users"] % PROGRESS_EVERY_USERS == 0:
+                    logger.info(f"Overdue notices: {stats['users']} users, {stats['loans']} loans queued")
+        cursor.close()
+    finally:
+        if connection.is_connected():
+            connection.close()
+        router.release(replica_index)
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["loans_per_second"] = round(stats["loans"] / elapsed, 1) if elapsed else 0.0
+    logger.info(
+        f"Overdue notices done: {stats['users']} users, {stats['loans']} loans, {stats['sent']} sent, "
+        f"{stats['failed']} failed in {stats['seconds']}s ({stats['loans_per_second']} loans/s)"
+    )
+    return stats
+
+
+def run_if_due(router, sender_factory, calculate_fine, interval_seconds, workers=DEFAULT_WORKERS):
+    """Run the job unless some process already did within ``interval_seconds``.
+
+    Every worker on every node runs a scheduler. A MySQL named lock stops two of them from starting
+    together, and job_runs records when the last run started. Returns the run's stats, or None if
+    it was skipped.
+    """
+    connection, _ = router.connect()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (f"campuslib-{JOB_NAME}",))
+        if cursor.fetchone()[0] != 1:
+            return None
+        try:
+            cursor.execute(
+                "SELECT last_run_at > NOW() - INTERVAL %s SECOND FROM job_runs WHERE name = %s",
+                (interval_seconds, JOB_NAME)
+            )
+            row = cursor.fetchone()
+            if row and row[0]:
+                connection.commit()
+                return None
+            cursor.execute(
+                "INSERT INTO job_runs (name, last_run_at) VALUES (%s, NOW()) ON DUPLICATE KEY UPDATE last_run_at = NOW()",
+                (JOB_NAME,)
+            )
+            connection.commit()
+            sender = sender_factory()
+            try:
+                return run_overdue_notices(router, sender, calculate_fine, workers)
+            finally:
+                sender.close()
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (f"campuslib-{JOB_NAME}",))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def start_scheduler(router, calculate_fine, interval_seconds, sender_factory, workers=DEFAULT_WORKERS):
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(min(interval_seconds, SCHEDULER_POLL_SECONDS)):
+            try:
+                run_if_due(router, sender_factory, calculate_fine, interval_seconds, workers)
+            except Error as e:
+                logger.error(f"Database error during overdue notice run: {e}")
+            except Exception:
+                # A sender failure (e.g. an unwritable output file) must not end scheduling for the worker's life
+                logger.exception("Overdue notice run failed")
+
+    threading.Thread(target=loop, name='overdue-notice-scheduler', daemon=True).start()
+    logger.info(f"Overdue notice scheduler started, every {interval_seconds}s")
+    return stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send notices to borrowers with overdue books.")
+    parser.add_argument('--output', help="Write notices as JSON lines to this file instead of the mock sender")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--fetch-size', type=int, default=DEFAULT_FETCH_SIZE)
+    parser.add_argument('--mock-latency', type=float, default=0.0, help="Seconds the mock sender sleeps per notice")
+    args = parser.parse_args()
+
+    from app import router, calculate_fine
+
+    sender = FileSender(args.output) if args.output else MockSender(args.mock_latency)
+    try:
+        stats = run_overdue_notices(router, sender, calculate_fine, args.workers, args.fetch_size)
+    finally:
+        sender.close()
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""Gunicorn worker classes. gunicorn.conf.py runs QueueTimedThreadWorker in place of plain gthread."""
+import time
+
+from gunicorn.workers.gthread import ThreadWorker
+
+from limits import queue_wait
+
+
+class QueueTimedThreadWorker(ThreadWorker):
+    """gthread worker that records how long each request waited for a free thread.
+
+    app.admit_request sheds requests that waited longer than MAX_QUEUE_WAIT_MS, so a backlog is answered
+    with fast 503s instead of being served late.
+    """
+
+    def enqueue_req(self, conn):
+        conn.queued_at = time.monotonic()
+        super().enqueue_req(conn)
+
+    def handle(self, conn):
+        queue_wait.seconds = time.monotonic() - conn.queued_at
+        try:
+            return super().handle(conn)
+        finally:
+            queue_wait.seconds = 0.0